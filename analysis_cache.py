@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from expand_long import LONG_COLUMNS, META_COLUMNS, expand_chunk
+from scoring import N_TRIALS, SCORE_COLUMNS, score_blocks, trial_blocks
+
+CACHE_DIR = ".analysis_cache"
+META_FILE = "meta.json"
+VERSION = 1  # Bump when scoring or expansion changes, to drop old caches
+
+
+def row_hashes(raw):
+    """64-bit content hash of every row, computed from the cells as written in the file."""
+    return pd.util.hash_pandas_object(raw, index=False).to_numpy()
+
+
+def _parse(raw):
+    """Turn the string cells of new rows into the values scoring expects.
+
+    Empty cells become NaN and the rtN columns numbers; other cells stay
+    strings, as read.
+    """
+    parsed = raw.mask(raw == "")
+    rt_columns = [column for column in raw.columns if column.startswith("rt") and column[2:].isdigit()]
+    parsed[rt_columns] = parsed[rt_columns].apply(pd.to_numeric)
+    return parsed
+
+
+def _append(kept, new):
+    """kept followed by new; empty frames are left out, as pandas no longer lets them set the dtypes."""
+    frames = [frame for frame in (kept, new) if len(frame)]
+    if not frames:
+        return new
+    return pd.concat(frames, ignore_index=True)
+
+
+class AnalysisCache:
+    """On-disk cache of per-session scores and long-format rows, keyed on row content.
+
+    Every (id, trial) row of the wide file is hashed from its raw cells. Rows
+    whose hash is already cached reuse their scores and long rows; only new
+    or edited rows are scored and expanded. Entries whose hash no longer
+    appears in the input (edited or removed sessions) are evicted when the
+    cache is saved.
+    """
+
+    def __init__(self, directory=CACHE_DIR, filters=None):
+        self.directory = directory
+        self.filters = filters or {}
+        self.scores = pd.DataFrame(columns=["hash"] + SCORE_COLUMNS)
+        self.long = pd.DataFrame(columns=["hash"] + LONG_COLUMNS)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path(META_FILE)):
+            return
+        with open(self._path(META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("version") != VERSION or meta.get("filters") != self.filters:
+            return  # Built with other settings, start over
+        self.scores = pd.read_pickle(self._path("scores.pkl"))
+        self.long = pd.read_pickle(self._path("long.pkl"))
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.scores.to_pickle(self._path("scores.pkl"))
+        self.long.to_pickle(self._path("long.pkl"))
+        with open(self._path(META_FILE), "w") as f:
+            json.dump({"version": VERSION, "filters": self.filters, "sessions": len(self.scores)}, f, indent=2)
+
+    def update(self, raw, n_trials=N_TRIALS):
+        """Bring the cache in line with the rows of raw (all cells as strings).
+
+        Returns (hashes, n_new): the hash of every input row and how many
+        distinct rows had to be computed.
+        """
+        hashes = row_hashes(raw)
+        unique_hashes, first = np.unique(hashes, return_index=True)
+        cached = self.scores["hash"].to_numpy(dtype=np.uint64)
+        new = ~np.isin(unique_hashes, cached)
+        positions = np.sort(first[new])
+        new_rows = _parse(raw.iloc[positions])
+        new_rows.insert(0, "hash", hashes[positions])
+
+        scores = pd.DataFrame(score_blocks(*trial_blocks(new_rows, n_trials)))
+        scores.insert(0, "hash", hashes[positions])
+        long = expand_chunk(new_rows, n_trials=n_trials, meta_columns=["hash"] + META_COLUMNS, **self.filters)
+
+        # Evict sessions that are no longer in the input, then add the new ones
+        keep_scores = np.isin(cached, unique_hashes)
+        keep_long = np.isin(self.long["hash"].to_numpy(dtype=np.uint64), unique_hashes)
+        self.scores = _append(self.scores[keep_scores], scores)
+        self.long = _append(self.long[keep_long], long)
+        return hashes, int(new.sum())
+
+    def scored(self, raw, hashes):
+        """raw with SCORE_COLUMNS filled in from the cache, in input order."""
+        lookup = self.scores.set_index("hash")
+        scored = raw.copy()
+        for column in SCORE_COLUMNS:
+            scored[column] = lookup[column].reindex(hashes).to_numpy()
+        return scored
+
+    def long_rows(self, hashes):
+        """Long-format rows of every input row, in input order."""
+        order = pd.DataFrame({"hash": hashes, "row": np.arange(len(hashes))})
+        long = order.merge(self.long, on="hash", how="inner", sort=False)
+        long = long.sort_values("row", kind="stable")
+        return long[LONG_COLUMNS].reset_index(drop=True)
+
+
+def group_summary(scored):
+    """Mean of every score per group and trial, as in the analysis notebooks."""
+    values = scored[["group", "trial"] + SCORE_COLUMNS].copy()
+    values["trial"] = pd.to_numeric(values["trial"])
+    values[SCORE_COLUMNS] = values[SCORE_COLUMNS].astype(np.float64)
+    summary = values.groupby(["group", "trial"])[SCORE_COLUMNS].agg(["mean", "count"])
+    summary.columns = [f"{column}_{stat}" for column, stat in summary.columns]
+    return summary.reset_index()
+
+
+def run(input_path, cache_dir=CACHE_DIR, n_trials=N_TRIALS, **filters):
+    """Score, expand and summarise a wide CSV, recomputing only new or changed sessions.
+
+    Returns (scored, long, summary, n_new).
+    """
+    raw = pd.read_csv(input_path, dtype=str, keep_default_na=False)
+    cache = AnalysisCache(cache_dir, filters)
+    hashes, n_new = cache.update(raw, n_trials)
+    cache.save()
+    scored = cache.scored(raw, hashes)
+    return scored, cache.long_rows(hashes), group_summary(scored), n_new
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally score and expand the wide session file.")
+    parser.add_argument("input", nargs="?", default="reaction_times.csv")
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--scored", default="rt_data_with_computed_averages.csv")
+    parser.add_argument("--long", default="expanded_rt_incon_accurate.csv")
+    parser.add_argument("--summary", default="group_summary.csv")
+    args = parser.parse_args()
+
+    scored, long, summary, n_new = run(args.input, args.cache)
+    scored.to_csv(args.scored, index=False)
+    long.to_csv(args.long, index=False)
+    summary.to_csv(args.summary, index=False)
+    print(f"{n_new} new or changed sessions computed, {len(scored)} sessions in total")
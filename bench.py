@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from analysis_cache import group_summary
+from expand_long import expand_chunk
+from inference import contrasts
+from mixed_models import Design, fit
+from scoring import score
+from session_store import N_TRIALS, SUMMARY_COLUMNS, wide_header
+
+BENCH_DIR = "bench_data"
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+MAX_MODEL_SESSIONS = 100_000  # Larger mixed-model fits take minutes each
+TOLERANCE = 1.5  # A stage regresses when it is this many times slower than the baseline
+MIN_SLACK_S = 0.05  # ... and slower by more than this, so millisecond stages do not flag on noise
+CHUNK = 100_000  # Sessions generated and written at a time
+COHORT_VERSION = 2  # Bump when synthetic_chunk changes, so cached cohorts are generated again
+
+
+def synthetic_chunk(rng, first_id, n_sessions, n_trials=N_TRIALS):
+    """Sessions in the reaction_times.csv layout: every id has a trial 1 and a trial 2 row.
+
+    RTs are log-normal around the course data (about 1.1 s incongruent,
+    1.0 s congruent) with a per-participant offset, 20% congruent trials
+    and about 95% correct answers; exercise participants get slightly
+    faster in trial 2.
+    """
+    ids = first_id + np.arange(n_sessions) // 2
+    trial = np.arange(n_sessions) % 2 + 1
+    exercise = ids % 2 == 0
+    congruent = rng.random((n_sessions, n_trials)) < 0.2
+    n_ids = ids.max() - first_id + 1
+    offset = rng.normal(0.0, 0.15, n_ids)[ids - first_id]
+    log_rt = (0.1 - 0.1 * congruent + offset[:, None] - 0.05 * ((trial == 2) & exercise)[:, None]
+              + rng.normal(0.0, 0.25, (n_sessions, n_trials)))
+    correct = rng.random((n_sessions, n_trials)) < 0.95
+
+    data = {
+        "id": ids,
+        "trial": trial,
+        "gender": np.where(rng.random(n_ids) < 0.5, "M", "F")[ids - first_id],  # Per participant, as age
+        "group": np.where(exercise, "exercise", "control"),
+        "age": rng.integers(18, 35, n_ids)[ids - first_id],
+        "time": "12:00:00",
+    }
+    for i in range(n_trials):
+        data[f"trial_type{i + 1}"] = congruent[:, i]
+    for i in range(n_trials):
+        data[f"rt{i + 1}"] = np.exp(log_rt[:, i])
+    for i in range(n_trials):
+        data[f"accuracy{i + 1}"] = np.where(correct[:, i], "Correct", "Incorrect")
+    for column in SUMMARY_COLUMNS:
+        data[column] = np.nan
+    return pd.DataFrame(data, columns=wide_header(n_trials))
+
+
+def cohort_csv(n_sessions, seed=0, directory=BENCH_DIR):
+    """Path of a synthetic wide CSV with n_sessions rows, generated once and reused."""
+    path = os.path.join(directory, f"cohort_{n_sessions}_{seed}_v{COHORT_VERSION}.csv")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        rng = np.random.default_rng([seed, n_sessions])
+        for start in range(0, n_sessions, CHUNK):
+            chunk = synthetic_chunk(rng, start // 2, min(CHUNK, n_sessions - start))
+            chunk.to_csv(path + ".tmp", mode="a" if start else "w", header=not start, index=False)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def group_split(scored):
+    """The exercise/control x trial 1/2 splits of the notebooks: contrasts and group means."""
+    contrasts(scored)
+    group_summary(scored)
+    return scored
+
+
+def stages(path, n_sessions, max_model_sessions=MAX_MODEL_SESSIONS):
+    """The analysis pipeline as (name, function) pairs; each function takes the previous stage's output."""
+    result = [
+        ("read_csv", lambda _: pd.read_csv(path)),
+        ("score", score),
+        ("group_split", group_split),
+        ("expand_long", lambda scored: expand_chunk(scored, congruency="all")),
+        ("design", Design),
+    ]
+    if max_model_sessions is None or n_sessions <= max_model_sessions:
+        result.append(("mixed_model", lambda design: fit(design, "incongruent", 2.5, "intercept")))
+    return result
+
+
+def measure(function, value, memory=True):
+    """Run function(value) and return (result, wall seconds, peak MiB allocated during the call)."""
+    start = time.perf_counter()
+    result = function(value)
+    wall = time.perf_counter() - start
+    peak = None
+    if memory:
+        # A second, traced run: tracing slows allocation-heavy code, so it is kept out of the timing
+        tracemalloc.start()
+        function(value)
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, wall, peak
+
+
+def run(sizes=SIZES, seed=0, repeat=1, memory=True, max_model_sessions=MAX_MODEL_SESSIONS, directory=BENCH_DIR):
+    """Time every stage at every cohort size; returns one dict per (stage, size).
+
+    The wall time is the best of repeat runs; rows/s counts the sessions
+    that went into the pipeline.
+    """
+    results = []
+    for n_sessions in sizes:
+        path = cohort_csv(n_sessions, seed, directory)
+        value = None
+        for name, function in stages(path, n_sessions, max_model_sessions):
+            walls = []
+            peak = None
+            for i in range(repeat):
+                output, wall, traced = measure(function, value, memory and i == 0)
+                walls.append(wall)
+                peak = traced if traced is not None else peak
+            value = output
+            wall = min(walls)
+            results.append({"stage": name, "sessions": n_sessions, "wall_s": wall, "peak_mib": peak,
+                            "rows_per_s": n_sessions / wall if wall > 0 else None})
+            print(f"{name:<12}{n_sessions:>10} sessions {wall:9.3f} s"
+                  + (f" {peak:9.1f} MiB" if peak is not None else ""), flush=True)
+    return results
+
+
+def environment():
+    return {"python": sys.version.split()[0], "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def compare(results, baseline):
+    """(stage, sessions, wall_s, threshold_s) of every result slower than its baseline threshold."""
+    thresholds = {(row["stage"], row["sessions"]): row["threshold_s"] for row in baseline["results"]}
+    return [(row["stage"], row["sessions"], row["wall_s"], thresholds[row["stage"], row["sessions"]])
+            for row in results
+            if (row["stage"], row["sessions"]) in thresholds
+            and row["wall_s"] > thresholds[row["stage"], row["sessions"]]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on synthetic cohorts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="sessions per cohort")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run that measures peak memory")
+    parser.add_argument("--max-model-sessions", type=int, default=MAX_MODEL_SESSIONS)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="threshold = wall time x tolerance")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to check for regressions")
+    parser.add_argument("--data", default=BENCH_DIR, help="directory for the generated cohorts")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.seed, args.repeat, not args.no_memory, args.max_model_sessions, args.data)
+    for row in results:
+        row["threshold_s"] = max(row["wall_s"] * args.tolerance, row["wall_s"] + MIN_SLACK_S)
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "tolerance": args.tolerance, "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        for stage, n_sessions, wall, threshold in regressions:
+            print(f"REGRESSION {stage} at {n_sessions} sessions: {wall:.3f} s > {threshold:.3f} s")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+from datetime import datetime
+
+import pygame
+
+from input_capture import InputCapture
+from scheduler import TrialScheduler
+from telemetry import refresh_interval_ns
+from timing import TrialClock, now_ns
+
+PROFILE_PATH = "station_profiles.json"
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+
+def measure_flips(screen, n_flips):
+    """Alternate black and white full-screen flips; returns (intervals_ns, flip_durations_ns)."""
+    clock = TrialClock()
+    onsets = []
+    durations = []
+    for i in range(n_flips + 1):
+        screen.fill(WHITE if i % 2 else BLACK)
+        onsets.append(clock.flip())
+        durations.append(clock.flip_ns)
+        pygame.event.pump()  # Keep the window responsive
+    intervals = [later - earlier for earlier, later in zip(onsets, onsets[1:])]
+    return intervals, durations[1:]
+
+
+def measure_loopback(screen, n_trials, capture):
+    """Flash a white patch and time the input an external trigger sends back.
+
+    Meant for a photodiode or button box wired to a key or mouse button: the
+    measured delay covers scan-out, the panel and the whole input stack.
+    Returns the latencies in ns; stops early if the window is closed.
+    """
+    clock = TrialClock()
+    scheduler = TrialScheduler(capture=capture)
+    is_input = lambda event: event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN)
+    patch = screen.get_rect().inflate(-screen.get_width() // 2, -screen.get_height() // 2)
+    latencies = []
+    for _ in range(n_trials):
+        screen.fill(BLACK)
+        pygame.display.flip()
+        if not scheduler.pause(random.randint(500, 1000)):
+            break
+        screen.fill(WHITE, patch)
+        clock.flip()
+        event = scheduler.wait(is_input, deadline_ns=now_ns() + 2_000_000_000)
+        if event is None:
+            clock.onset_ns = None  # Trigger missed the flash
+            continue
+        if event.type == pygame.QUIT:
+            break
+        clock.record_response(event)
+        latencies.append(clock.responses_ns[-1] - clock.onsets_ns[-1])
+    return latencies
+
+
+def calibrate(n_flips=120, loopback_trials=0, size=(1500, 800)):
+    """Measure the display timing of this station and return its latency profile.
+
+    The window is opened the way the tasks open theirs, so the flips behave
+    as they do during a session. Without vsync, flips return at once and
+    the frame is picked up at the next refresh, on average half an interval
+    later (pickup_ns); scan-out then takes a fraction of an interval that
+    depends on where the stimulus is, see latency_correction(). A loopback
+    measurement, when available, replaces the estimate.
+    """
+    pygame.init()
+    screen = pygame.display.set_mode(size)
+    pygame.display.set_caption("Calibration")
+    intervals, durations = measure_flips(screen, n_flips)
+    median_interval = statistics.median(intervals)
+    nominal_ns = refresh_interval_ns()
+    vsync = median_interval >= nominal_ns // 2
+    refresh_ns = int(median_interval) if vsync else nominal_ns  # Flips paced by vsync measure the real refresh
+    pickup_ns = 0 if vsync else refresh_ns // 2
+
+    loopback_ns = None
+    if loopback_trials:
+        capture = InputCapture()
+        capture.start()
+        latencies = measure_loopback(screen, loopback_trials, capture)
+        capture.stop()
+        if latencies:
+            loopback_ns = int(statistics.median(latencies))
+    pygame.quit()
+
+    return {
+        "calibrated": datetime.now().isoformat(timespec="seconds"),
+        "nominal_refresh_ns": nominal_ns,
+        "refresh_ns": refresh_ns,
+        "refresh_jitter_ns": int(statistics.pstdev(intervals)),
+        "flip_median_ns": int(statistics.median(durations)),
+        "vsync": vsync,
+        "pickup_ns": pickup_ns,
+        "loopback_ns": loopback_ns,
+    }
+
+
+def load_profiles(path=PROFILE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_profile(profile, station=None, path=PROFILE_PATH):
+    """Store the profile under the station name (this host by default)."""
+    profiles = load_profiles(path)
+    profiles[station or socket.gethostname()] = profile
+    with open(path, "w") as f:
+        json.dump(profiles, f, indent=2)
+
+
+def load_profile(station=None, path=PROFILE_PATH):
+    """Profile of the station (this host by default), or None if it was never calibrated."""
+    return load_profiles(path).get(station or socket.gethostname())
+
+
+def latency_correction(profile, stimulus_y=0.5):
+    """Seconds to subtract from this station's RTs, or None without a profile.
+
+    stimulus_y is the height of the stimulus as a fraction of the screen
+    height, from the top: scan-out reaches it that fraction of a refresh
+    interval after the frame is picked up. The loopback latency is used
+    as measured.
+    """
+    if profile is None:
+        return None
+    if profile["loopback_ns"] is not None:
+        return profile["loopback_ns"] / 1_000_000_000
+    return (profile["pickup_ns"] + profile["refresh_ns"] * stimulus_y) / 1_000_000_000
+
+
+def refresh_ns(profile):
+    """Measured refresh interval of this station in ns, or None without a profile."""
+    if profile is None:
+        return None
+    return profile["refresh_ns"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure display and input latency of this station.")
+    parser.add_argument("--flips", type=int, default=120, help="flips used to measure the refresh interval")
+    parser.add_argument("--loopback", type=int, default=0, metavar="TRIALS",
+                        help="also time this many flashes answered by an external trigger")
+    parser.add_argument("--station", default=None, help="name to store the profile under (default: hostname)")
+    parser.add_argument("--profiles", default=PROFILE_PATH)
+    args = parser.parse_args()
+
+    profile = calibrate(args.flips, args.loopback)
+    save_profile(profile, args.station, args.profiles)
+    print(json.dumps(profile, indent=2))
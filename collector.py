@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from session_store import DB_PATH, SessionStore
+
+CENTRAL_DB = "central.db"
+PORT = 8765
+SPOOL_DIR = "spool"
+HEADER = struct.Struct("!I")  # Length of the compressed payload that follows
+MAX_FRAME = 64 * 1024 * 1024
+TIMEOUT_S = 10.0
+RECORD_FIELDS = ["task", "id", "trial", "gender", "group", "age", "time", "seed", "correction", "trials"]
+
+
+def encode(value):
+    data = zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+    return HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader):
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if size > MAX_FRAME:
+        raise ValueError(f"frame of {size} bytes is too large")
+    return json.loads(zlib.decompress(await reader.readexactly(size)))
+
+
+def to_record(task, session, trials):
+    """A stored session as a JSON-friendly dict, as sent over the wire."""
+    participant_id, trial, gender, group, age, current_time, seed, correction = session
+    return {"task": task, "id": participant_id, "trial": trial, "gender": gender, "group": group, "age": age,
+            "time": current_time, "seed": seed, "correction": correction, "trials": [list(row) for row in trials]}
+
+
+def check_record(record):
+    """Return why a received record cannot be stored, or None if it is well-formed."""
+    if not isinstance(record, dict):
+        return "not an object"
+    missing = [field for field in RECORD_FIELDS if field not in record]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if not isinstance(record["task"], str) or not isinstance(record["id"], (str, int)):
+        return "task and id must be strings"
+    if not isinstance(record["trial"], int) or not isinstance(record["trials"], list):
+        return "trial must be an integer and trials a list"
+    for row in record["trials"]:
+        if not isinstance(row, list) or len(row) != 4:
+            return "every trial must be [n, congruent, rt, correct]"
+        if row[2] is not None and not isinstance(row[2], (int, float)):
+            return "rt must be a number"
+    return None
+
+
+def store_records(store, records):
+    """Save records that are not in the store yet; returns (stored, duplicates, rejected).
+
+    A session already stored under the same (task, id, trial) is skipped,
+    so a batch that is resent after a lost acknowledgement is harmless.
+    Malformed records, or records the store refuses, are not stored and
+    are returned in rejected as (position in the batch, reason); the rest
+    of the batch is stored regardless.
+    """
+    stored = duplicates = 0
+    rejected = []
+    if not isinstance(records, list):
+        return 0, 0, [(None, "batch must be a list of records")]
+    for i, record in enumerate(records):
+        reason = check_record(record)
+        if reason is not None:
+            rejected.append((i, reason))
+            continue
+        if store.exists(record["id"], record["trial"], record["task"]):
+            duplicates += 1
+            continue
+        trials = record["trials"]
+        try:
+            store.save_session(record["task"], record["id"], record["trial"], record["gender"], record["group"],
+                               record["age"], record["time"], [rt for _, _, rt, _ in trials],
+                               [congruent for _, congruent, _, _ in trials],
+                               [correct for _, _, _, correct in trials], record["seed"])
+            if record["correction"] is not None:
+                with store.conn:
+                    store.set_correction(record["task"], record["id"], record["trial"], record["correction"])
+        except sqlite3.Error as error:
+            rejected.append((i, str(error)))
+            continue
+        stored += 1
+    return stored, duplicates, rejected
+
+
+class CollectorServer:
+    """asyncio server that receives batches of sessions from the stations.
+
+    Every connection may send any number of frames, each a zlib-compressed
+    JSON list of session records, and gets a {"stored", "duplicates",
+    "rejected"} acknowledgement back. All writes go through one thread that owns the
+    central SessionStore, so many stations can upload at once without
+    contending for the database file.
+    """
+
+    def __init__(self, path=CENTRAL_DB):
+        self.path = path
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="collector-store")
+        self.store = None
+
+    async def _call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    records = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break  # Station closed the connection
+                stored, duplicates, rejected = await self._call(store_records, self.store, records)
+                writer.write(encode({"stored": stored, "duplicates": duplicates, "rejected": rejected}))
+                await writer.drain()
+                print(f"{peer[0]}: stored {stored} sessions, {duplicates} duplicates, {len(rejected)} rejected")
+                for position, reason in rejected:
+                    print(f"{peer[0]}:   rejected record {position}: {reason}")
+        except (ConnectionError, ValueError, zlib.error) as error:
+            print(f"{peer[0]}: dropped connection ({error})")
+        finally:
+            writer.close()
+
+    async def serve(self, host="0.0.0.0", port=PORT):
+        # The store is opened on the executor thread, which is the only one that uses it
+        self.store = await self._call(SessionStore, self.path)
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class CollectorClient:
+    """Pushes finished sessions to a CollectorServer from a background event loop.
+
+    send() only hands the record to the loop. Records that queue up are
+    sent together as one compressed batch, over a small pool of kept-open
+    connections. A batch that cannot be delivered is written to the spool
+    directory and retried every retry_s seconds, so a station can keep
+    recording while the server or the network is down. close() spools
+    whatever is still queued or in flight instead of waiting for the
+    network.
+    """
+
+    def __init__(self, host="localhost", port=PORT, spool_dir=SPOOL_DIR, pool_size=2, batch_size=50,
+                 retry_s=30.0):
+        self.host = host
+        self.port = port
+        self.spool_dir = spool_dir
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.retry_s = retry_s
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="collector-client", daemon=True)
+        self._thread.start()
+        self._run(self._setup())
+
+    def _run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    async def _setup(self):
+        self._queue = asyncio.Queue()
+        self._idle = asyncio.Queue()  # Open (reader, writer) connections
+        self._slots = asyncio.Semaphore(self.pool_size)
+        self._spool_lock = asyncio.Lock()  # One pass over the spool at a time
+        self._pending = set()  # Batches being delivered
+        self._tasks = [asyncio.create_task(self._send_loop()), asyncio.create_task(self._retry_loop())]
+
+    def send(self, record):
+        """Queue one session record; returns at once."""
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, record)
+
+    def flush(self, timeout=None):
+        """Wait until every queued record was acknowledged or spooled."""
+        self._run(self._queue.join(), timeout)
+
+    def retry_spool(self, timeout=None):
+        """Try to deliver the spooled batches now; returns the number still spooled."""
+        return self._run(self._deliver_spool(), timeout)
+
+    def close(self, timeout=1.0):
+        """Give queued records up to timeout seconds to be delivered, spool the rest and stop."""
+        try:
+            self.flush(timeout)
+        except TimeoutError:
+            pass  # Server slow or unreachable; _shutdown spools what is left
+        self._run(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    async def _shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        # Cancelled deliveries spool their batch; records not yet picked up are spooled here
+        for task in list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._pending, return_exceptions=True)
+        left = []
+        while not self._queue.empty():
+            left.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if left:
+            self._spool(encode(left))
+        while not self._idle.empty():
+            _, writer = self._idle.get_nowait()
+            writer.close()
+
+    async def _request(self, payload):
+        """Send one encoded batch over a pooled connection and return the acknowledgement."""
+        async with self._slots:
+            if self._idle.empty():
+                connection = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), TIMEOUT_S)
+            else:
+                connection = self._idle.get_nowait()
+            reader, writer = connection
+            try:
+                writer.write(payload)
+                await writer.drain()
+                ack = await asyncio.wait_for(read_frame(reader), TIMEOUT_S)
+            except BaseException:
+                writer.close()  # The connection is in an unknown state, never reuse it
+                raise
+            self._idle.put_nowait(connection)
+            return ack
+
+    async def _deliver(self, records):
+        payload = encode(records)
+        try:
+            ack = await self._request(payload)
+            for position, reason in ack.get("rejected", []):
+                print(f"collector client: server rejected a record ({reason})", file=sys.stderr)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            self._spool(payload)
+        except asyncio.CancelledError:
+            self._spool(payload)  # Closing while the batch was in flight
+            raise
+        finally:
+            for _ in records:
+                self._queue.task_done()
+
+    async def _send_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            task = asyncio.create_task(self._deliver(batch))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    def _spool(self, payload):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"{time.time_ns()}.batch")
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+
+    async def _deliver_spool(self):
+        async with self._spool_lock:
+            paths = sorted(glob.glob(os.path.join(self.spool_dir, "*.batch")))
+            for i, path in enumerate(paths):
+                try:
+                    with open(path, "rb") as f:
+                        payload = f.read()
+                except FileNotFoundError:
+                    continue  # Removed by hand or by another client on the same spool
+                try:
+                    await self._request(payload)
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    return len(paths) - i  # Still offline, keep the rest for later
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            return 0
+
+    async def _retry_loop(self):
+        while True:
+            try:
+                await self._deliver_spool()
+            except Exception as error:
+                print(f"collector client: retrying the spool failed: {error!r}", file=sys.stderr)
+            await asyncio.sleep(self.retry_s)
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(":")
+    return (host or "localhost"), int(port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect sessions from many stations into one central store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the collection server")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--db", default=CENTRAL_DB)
+    push = commands.add_parser("push", help="send every complete local session and the spool to a server")
+    push.add_argument("server", type=parse_address, help="host:port")
+    push.add_argument("--db", default=DB_PATH)
+    push.add_argument("--spool", default=SPOOL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        print(f"Collecting into {args.db} on {args.host}:{args.port}")
+        try:
+            asyncio.run(CollectorServer(args.db).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        store = SessionStore(args.db)
+        client = CollectorClient(*args.server, spool_dir=args.spool)
+        sent = 0
+        for task in ("stroop", "word", "reaction"):
+            for session, trials in store.sessions(task):
+                client.send(to_record(task, session, trials))
+                sent += 1
+        client.flush()
+        left = client.retry_spool()
+        client.close()
+        store.close()
+        print(f"Sent {sent} sessions, {left} batches left in {args.spool}")
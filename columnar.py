@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from scoring import N_TRIALS, SCORE_COLUMNS, trial_blocks
+
+META_FILE = "meta.json"
+SESSION_DIR = "sessions"
+
+# On-disk dtypes; categorical columns are stored as codes
+TRIAL_DTYPES = {
+    "session": np.int32,  # Row of the trial's session in the session table
+    "n": np.int8,  # Position of the trial within the session, from 1
+    "rt": np.float64,
+    "congruent": np.bool_,
+    "correct": np.bool_,
+}
+SESSION_DTYPES = {
+    "id": np.int64,
+    "trial": np.int8,
+    "age": np.int16,
+    "group": np.int8,
+    "gender": np.int8,
+    "time": np.int32,
+}
+CATEGORICAL = ["group", "gender", "time"]
+SESSION_COLUMNS = ["id", "trial", "gender", "group", "age", "time"]  # Order of the wide layout
+
+
+def from_wide(data, n_trials=N_TRIALS):
+    """Convert wide sessions into typed session and trial-level columns.
+
+    Returns (columns, sessions, categories): a dict of NumPy arrays with one
+    entry per answered trial, a dict with one entry per row of data (so
+    sessions without an answered trial are kept), and the category labels
+    of the categorical session columns.
+    """
+    congruent, rt, correct = trial_blocks(data, n_trials)
+    rows, positions = np.nonzero(~np.isnan(rt))
+
+    columns = {
+        "session": rows,
+        "n": positions + 1,
+        "rt": rt[rows, positions],
+        "congruent": congruent[rows, positions],
+        "correct": correct[rows, positions],
+    }
+    sessions = {name: data[name].to_numpy() for name in ["id", "trial", "age"]}
+    categories = {}
+    for name in CATEGORICAL:
+        codes, labels = pd.factorize(data[name].astype(str))
+        sessions[name] = codes
+        categories[name] = [str(label) for label in labels]
+    return ({name: np.ascontiguousarray(values, dtype=TRIAL_DTYPES[name]) for name, values in columns.items()},
+            {name: np.ascontiguousarray(values, dtype=SESSION_DTYPES[name]) for name, values in sessions.items()},
+            categories)
+
+
+def save(directory, columns, sessions, categories):
+    """Write one .npy file per column, the session table under sessions/, and a meta.json."""
+    os.makedirs(os.path.join(directory, SESSION_DIR), exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(directory, f"{name}.npy"), values)
+    for name, values in sessions.items():
+        np.save(os.path.join(directory, SESSION_DIR, f"{name}.npy"), values)
+    meta = {"n_rows": len(columns["rt"]), "columns": list(columns),
+            "n_sessions": len(sessions["id"]), "session_columns": list(sessions), "categories": categories}
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def load(directory, mmap=True):
+    """Load the columns of a directory written by save().
+
+    With mmap the arrays are memory-mapped read-only, so nothing is parsed
+    or copied until the data is used. Returns (columns, sessions, categories).
+    """
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+    columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+               for name in meta["columns"]}
+    sessions = {name: np.load(os.path.join(directory, SESSION_DIR, f"{name}.npy"), mmap_mode=mmap_mode)
+                for name in meta["session_columns"]}
+    return columns, sessions, meta["categories"]
+
+
+def _decoded(sessions, categories, name):
+    values = np.asarray(sessions[name])
+    if name in categories:
+        return pd.Categorical.from_codes(values, categories=categories[name])
+    return values
+
+
+def to_frame(columns, sessions, categories):
+    """Trial-level DataFrame with the session columns of every trial, categorical columns decoded."""
+    session = np.asarray(columns["session"])
+    frame = pd.DataFrame({name: values for name, values in columns.items()})
+    for name in SESSION_COLUMNS:
+        frame[name] = _decoded(sessions, categories, name)[session]
+    return frame
+
+
+def to_long(columns, sessions, categories):
+    """Rows in the layout of expanded_rt_incon_accurate.csv, for every stored trial."""
+    frame = to_frame(columns, sessions, categories)
+    frame["trial_type"] = np.where(frame["congruent"], "Congruent", "Incongruent")
+    return frame[["id", "trial", "gender", "group", "age", "time", "rt", "trial_type"]]
+
+
+def to_wide(columns, sessions, categories, n_trials=N_TRIALS):
+    """Sessions in the wide reaction_times.csv layout, including those without an answered trial."""
+    session = np.asarray(columns["session"])
+    n_sessions = len(sessions["id"])
+    position = np.asarray(columns["n"]) - 1
+
+    wide = {name: np.asarray(_decoded(sessions, categories, name), dtype=object) if name in categories
+            else np.asarray(sessions[name]) for name in SESSION_COLUMNS}
+    trial_type = np.full((n_sessions, n_trials), None, dtype=object)
+    rt = np.full((n_sessions, n_trials), np.nan)
+    accuracy = np.full((n_sessions, n_trials), None, dtype=object)
+    trial_type[session, position] = np.where(columns["congruent"], "True", "False")
+    rt[session, position] = columns["rt"]
+    accuracy[session, position] = np.where(columns["correct"], "Correct", "Incorrect")
+    for i in range(n_trials):
+        wide[f"trial_type{i + 1}"] = trial_type[:, i]
+    for i in range(n_trials):
+        wide[f"rt{i + 1}"] = rt[:, i]
+    for i in range(n_trials):
+        wide[f"accuracy{i + 1}"] = accuracy[:, i]
+    for name in SCORE_COLUMNS:
+        wide[name] = np.nan
+    return pd.DataFrame(wide)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between the CSV layouts and the columnar .npy format.")
+    parser.add_argument("command", choices=["from-csv", "to-wide", "to-long"])
+    parser.add_argument("source", help="wide CSV for from-csv, column directory otherwise")
+    parser.add_argument("target", help="column directory for from-csv, CSV otherwise")
+    args = parser.parse_args()
+
+    if args.command == "from-csv":
+        save(args.target, *from_wide(pd.read_csv(args.source)))
+    elif args.command == "to-wide":
+        to_wide(*load(args.source)).to_csv(args.target, index=False)
+    else:
+        to_long(*load(args.source)).to_csv(args.target, index=False)
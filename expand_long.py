@@ -0,0 +1,70 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from scoring import N_TRIALS, trial_blocks
+
+META_COLUMNS = ["id", "trial", "gender", "group", "age", "time"]
+LONG_COLUMNS = META_COLUMNS + ["rt", "trial_type"]
+
+
+def expand_chunk(data, congruency="incongruent", accuracy="correct", max_rt=None, n_trials=N_TRIALS,
+                 meta_columns=META_COLUMNS):
+    """Turn wide sessions into one row per kept trial, in session then trial order.
+
+    congruency is "incongruent", "congruent" or "all", accuracy is "correct",
+    "incorrect" or "all", and trials with an RT of max_rt or more are dropped.
+    meta_columns are the session columns repeated on every trial row.
+    """
+    congruent, rt, correct = trial_blocks(data, n_trials)
+    keep = np.ones(rt.shape, dtype=bool)
+    if congruency == "incongruent":
+        keep &= ~congruent
+    elif congruency == "congruent":
+        keep &= congruent
+    if accuracy == "correct":
+        keep &= correct
+    elif accuracy == "incorrect":
+        keep &= ~correct
+    if max_rt is not None:
+        keep &= rt < max_rt
+
+    rows, columns = np.nonzero(keep)
+    long = data[meta_columns].iloc[rows].reset_index(drop=True)
+    long["rt"] = rt[rows, columns]
+    long["trial_type"] = np.where(congruent[rows, columns], "Congruent", "Incongruent")
+    return long
+
+
+def expand_csv(input_path, output_path, chunksize=100_000, **filters):
+    """Stream a wide CSV into the long layout read by expanded_model.R.
+
+    Only one chunk of sessions is held in memory at a time. Returns the
+    number of trial rows written.
+    """
+    written = 0
+    header = True
+    for chunk in pd.read_csv(input_path, chunksize=chunksize):
+        long = expand_chunk(chunk, **filters)
+        long.to_csv(output_path, mode="w" if header else "a", header=header, index=False)
+        header = False
+        written += len(long)
+    if header:
+        pd.DataFrame(columns=LONG_COLUMNS).to_csv(output_path, index=False)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert wide Stroop sessions to one row per trial.")
+    parser.add_argument("input", nargs="?", default="reaction_times.csv")
+    parser.add_argument("output", nargs="?", default="expanded_rt_incon_accurate.csv")
+    parser.add_argument("--congruency", choices=["incongruent", "congruent", "all"], default="incongruent")
+    parser.add_argument("--accuracy", choices=["correct", "incorrect", "all"], default="correct")
+    parser.add_argument("--max-rt", type=float, default=None, help="drop trials with an RT at or above this (s)")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="sessions read per chunk")
+    args = parser.parse_args()
+
+    n_rows = expand_csv(args.input, args.output, args.chunksize, congruency=args.congruency,
+                        accuracy=args.accuracy, max_rt=args.max_rt)
+    print(f"Wrote {n_rows} trials to {args.output}")
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Run without a display: must be set before pygame is imported
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import reaction
+import stroop
+import test as word_stroop
+from scheduler import SPIN_NS, TrialScheduler
+from timing import now_ns, ns_to_s
+
+TASKS = ["reaction", "stroop", "word"]
+
+
+class SimulatedParticipant:
+    """Answers every stimulus after a random latency drawn from a clipped normal distribution."""
+
+    def __init__(self, latency_mean=0.45, latency_sd=0.1, min_latency=0.15, seed=None):
+        self.latency_mean = latency_mean
+        self.latency_sd = latency_sd
+        self.min_latency = min_latency
+        self.rng = random.Random(seed)
+
+    def latency_ns(self):
+        latency = max(self.rng.gauss(self.latency_mean, self.latency_sd), self.min_latency)
+        return int(latency * 1_000_000_000)
+
+
+class HarnessScheduler(TrialScheduler):
+    """Scheduler that lets a simulated participant answer whenever the task waits for input.
+
+    While a stimulus is on screen (the task's clock has an onset), the
+    response is posted from a separate thread at onset + latency, so the task
+    sees it the same way it would see a real key press or click. Any other
+    wait for input (start and continue screens) is answered right away.
+    Pauses and go-signal delays are shortened by time_scale.
+    """
+
+    def __init__(self, task, kind, participant, time_scale=1.0):
+        super().__init__()
+        self.task = task
+        self.kind = kind
+        self.participant = participant
+        self.time_scale = time_scale
+        self.injected_ns = []  # Intended latency of each response
+        self.posted_ns = []  # Actual post time minus onset of each response
+
+    def wait(self, accept, deadline_ns=None):
+        if deadline_ns is not None:
+            # A pause or go-signal delay with no expected input: compress it
+            remaining = max(deadline_ns - now_ns(), 0)
+            return super().wait(accept, now_ns() + int(remaining * self.time_scale))
+
+        onset_ns = self.task.clock.onset_ns
+        if onset_ns is None:
+            pygame.event.post(self.advance_event())
+        else:
+            latency_ns = self.participant.latency_ns()
+            self.injected_ns.append(latency_ns)
+            threading.Thread(target=self._respond, args=(onset_ns + latency_ns, onset_ns), daemon=True).start()
+        return super().wait(accept)
+
+    def advance_event(self):
+        """Space press or click on the black circle that moves past a start screen."""
+        if self.kind == "reaction":
+            return pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE)
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(self.task.screen_width // 2, 250), button=1)
+
+    def response_event(self):
+        """Space press, or click on a random answer button."""
+        if self.kind == "reaction":
+            return pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE)
+        button_rect = self.participant.rng.choice(self.task.buttons)[0]
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=button_rect.center, button=1)
+
+    def _respond(self, due_ns, onset_ns):
+        # Sleep most of the way, then spin so the event is posted on time
+        remaining = due_ns - now_ns() - SPIN_NS
+        if remaining > 0:
+            time.sleep(remaining / 1_000_000_000)
+        while now_ns() < due_ns:
+            pass
+        event = self.response_event()
+        posted_ns = now_ns()
+        pygame.event.post(event)
+        self.posted_ns.append(posted_ns - onset_ns)
+
+
+def make_task(kind):
+    if kind == "reaction":
+        return reaction.ReactionTimeTest()
+    if kind == "stroop":
+        return stroop.StroopTest()
+    return word_stroop.StroopTest()
+
+
+def run_block(task, kind):
+    """Run one practice block, which never touches the session store."""
+    if kind == "reaction":
+        task.reaction_time_test(0, 1, "M", "control", 30, "00:00:00", practice=True)
+    else:
+        task.run_test(0, 1, "control", "M", 30, "00:00:00", practice=True)
+
+
+def simulate(kind, n_trials, participant, time_scale=0.01):
+    """Run practice blocks of a task until n_trials responses were recorded.
+
+    Returns a list of (injected, posted, recorded) latencies in seconds.
+    """
+    results = []
+    task = make_task(kind)
+    scheduler = task.scheduler = HarnessScheduler(task, kind, participant, time_scale)
+    while len(results) < n_trials:
+        task.clock.reset()
+        run_block(task, kind)
+
+        recorded = [response - onset for onset, response in zip(task.clock.onsets_ns, task.clock.responses_ns)]
+        for injected, posted, measured in zip(scheduler.injected_ns, scheduler.posted_ns, recorded):
+            results.append((ns_to_s(injected), ns_to_s(posted), ns_to_s(measured)))
+        scheduler.injected_ns, scheduler.posted_ns = [], []
+    return results[:n_trials]
+
+
+def summarize(results):
+    """Measurement error of the recorded RTs against the injected latencies, in ms.
+
+    post_lag_ms is how late the harness itself posted the events, so it can
+    be told apart from the error added by the task.
+    """
+    errors = sorted((measured - injected) * 1000 for injected, _, measured in results)
+    return {
+        "n": len(errors),
+        "bias_ms": statistics.fmean(errors),
+        "jitter_ms": statistics.pstdev(errors),
+        "p99_ms": errors[min(len(errors) - 1, math.ceil(0.99 * len(errors)) - 1)],
+        "max_ms": errors[-1],
+        "post_lag_ms": statistics.fmean((posted - injected) * 1000 for injected, posted, _ in results),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a task headless with a simulated participant.")
+    parser.add_argument("--task", choices=TASKS, default="stroop")
+    parser.add_argument("--trials", type=int, default=100)
+    parser.add_argument("--latency-mean", type=float, default=0.45, help="seconds")
+    parser.add_argument("--latency-sd", type=float, default=0.1, help="seconds")
+    parser.add_argument("--min-latency", type=float, default=0.15, help="seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--time-scale", type=float, default=0.01, help="factor applied to pauses and delays")
+    parser.add_argument("--max-bias-ms", type=float, default=None, help="fail if the mean error exceeds this")
+    parser.add_argument("--out", default=None, help="CSV file for per-trial latencies")
+    args = parser.parse_args()
+
+    participant = SimulatedParticipant(args.latency_mean, args.latency_sd, args.min_latency, args.seed)
+    cwd = os.getcwd()
+    out = os.path.abspath(args.out) if args.out else None
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # Keep the session store of the simulated runs out of the project
+        results = simulate(args.task, args.trials, participant, args.time_scale)
+        os.chdir(cwd)
+
+    if out:
+        with open(out, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["injected", "posted", "recorded"])
+            writer.writerows(results)
+
+    summary = summarize(results)
+    print(", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in summary.items()))
+    if args.max_bias_ms is not None and abs(summary["bias_ms"]) > args.max_bias_ms:
+        sys.exit(1)
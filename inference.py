@@ -0,0 +1,208 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from scoring import score
+
+BATCH_SIZE = 10_000  # Resamples drawn per worker task
+GROUPS = ["exercise", "control"]
+CONTRASTS = ([f"exercise_vs_control_tr{trial}" for trial in (1, 2)]
+             + [f"{group}_tr2_minus_tr1" for group in GROUPS] + ["group_x_trial"])  # Names used by contrasts()
+
+
+def contrasts(data, measure="avg_incongruent"):
+    """The pre/post x exercise/control contrasts of the notebooks as plain arrays.
+
+    Sessions with a measure of 0.0 had no correct trials of that type and
+    are left out, as in analysis_V3. Returns {name: (kind, samples)} where
+    kind is "independent" with samples (a, b), compared as mean(a) - mean(b),
+    or "paired" with samples (differences,).
+    """
+    data = data[data[measure] != 0.0]
+    split = {(group, trial): data[(data["group"] == group) & (data["trial"] == trial)]
+             for group in GROUPS for trial in (1, 2)}
+
+    result = {}
+    for trial in (1, 2):
+        result[f"exercise_vs_control_tr{trial}"] = (
+            "independent", (split["exercise", trial][measure].to_numpy(dtype=np.float64),
+                            split["control", trial][measure].to_numpy(dtype=np.float64)))
+    changes = {}
+    for group in GROUPS:
+        paired = split[group, 1][["id", measure]].merge(split[group, 2][["id", measure]], on="id",
+                                                        suffixes=("_1", "_2"))
+        changes[group] = (paired[f"{measure}_2"] - paired[f"{measure}_1"]).to_numpy(dtype=np.float64)
+        result[f"{group}_tr2_minus_tr1"] = ("paired", (changes[group],))
+    # Group x trial interaction: does the pre/post change differ between groups?
+    result["group_x_trial"] = ("independent", (changes["exercise"], changes["control"]))
+    return result
+
+
+def statistic(kind, samples):
+    if kind == "paired":
+        return samples[0].mean()
+    return samples[0].mean() - samples[1].mean()
+
+
+def permutation_batch(kind, samples, n_resamples, seed):
+    """Statistics of n_resamples permutations under the null, as one (n_resamples,) array.
+
+    Independent samples are relabelled by shuffling the pooled values of
+    every resample row at once; paired differences get random signs.
+    """
+    rng = np.random.default_rng(seed)
+    if kind == "paired":
+        (differences,) = samples
+        signs = rng.choice(np.array([-1.0, 1.0]), size=(n_resamples, len(differences)))
+        return (signs * differences).mean(axis=1)
+    a, b = samples
+    pooled = np.broadcast_to(np.concatenate([a, b]), (n_resamples, len(a) + len(b)))
+    shuffled = rng.permuted(pooled, axis=1)
+    return shuffled[:, :len(a)].mean(axis=1) - shuffled[:, len(a):].mean(axis=1)
+
+
+def bootstrap_batch(kind, samples, n_resamples, seed):
+    """Statistics of n_resamples bootstrap resamples, each sample resampled on its own."""
+    rng = np.random.default_rng(seed)
+    means = [values[rng.integers(0, len(values), size=(n_resamples, len(values)))].mean(axis=1)
+             for values in samples]
+    return means[0] if kind == "paired" else means[0] - means[1]
+
+
+def power_batch(kind, samples, effect, n_per_group, alpha, n_sims, seed):
+    """Number of significant t-tests among n_sims simulated studies.
+
+    Each study draws n_per_group values per sample from the observed values
+    centred on zero, shifts the first sample by effect and runs a Welch (or
+    one-sample, for paired) t-test, all simulations in one array operation.
+    """
+    rng = np.random.default_rng(seed)
+    drawn = [values - values.mean() for values in samples]
+    drawn = [values[rng.integers(0, len(values), size=(n_sims, n_per_group))] for values in drawn]
+    drawn[0] = drawn[0] + effect
+    if kind == "paired":
+        p_values = stats.ttest_1samp(drawn[0], 0.0, axis=1).pvalue
+    else:
+        p_values = stats.ttest_ind(drawn[0], drawn[1], axis=1, equal_var=False).pvalue
+    return int((p_values < alpha).sum())
+
+
+def _batches(n_resamples, batch_size, seed_sequence):
+    """Split n_resamples into batches with independent child seeds.
+
+    The seeds depend only on the base seed and the batch index, so the
+    results do not change with the number of workers.
+    """
+    sizes = [batch_size] * (n_resamples // batch_size)
+    if n_resamples % batch_size:
+        sizes.append(n_resamples % batch_size)
+    return zip(sizes, seed_sequence.spawn(len(sizes)))
+
+
+def _p_value(null, observed):
+    """Two-sided permutation p-value, counting the observed arrangement."""
+    return (np.count_nonzero(np.abs(null) >= abs(observed) - 1e-12) + 1) / (len(null) + 1)
+
+
+def infer(data, measure="avg_incongruent", n_resamples=100_000, seed=0, confidence=0.95,
+          batch_size=BATCH_SIZE, executor=None):
+    """Permutation p-values and bootstrap CIs for every contrast.
+
+    Batches run on executor (a concurrent.futures executor) when given, in
+    this process otherwise. Returns a DataFrame with one row per contrast.
+    """
+    submit = executor.submit if executor is not None else _run_now
+    table = contrasts(data, measure)
+    jobs = {}
+    for index, (name, (kind, samples)) in enumerate(table.items()):
+        for method_index, (method, batch) in enumerate((("permutation", permutation_batch),
+                                                         ("bootstrap", bootstrap_batch))):
+            seed_sequence = np.random.SeedSequence([seed, index, method_index])
+            jobs[name, method] = [submit(batch, kind, samples, size, child)
+                                  for size, child in _batches(n_resamples, batch_size, seed_sequence)]
+
+    rows = []
+    tail = (1 - confidence) / 2
+    for name, (kind, samples) in table.items():
+        observed = statistic(kind, samples)
+        null = np.concatenate([job.result() for job in jobs[name, "permutation"]])
+        boot = np.concatenate([job.result() for job in jobs[name, "bootstrap"]])
+        low, high = np.quantile(boot, [tail, 1 - tail])
+        rows.append({
+            "contrast": name,
+            "measure": measure,
+            "n_a": len(samples[0]),
+            "n_b": len(samples[1]) if kind == "independent" else len(samples[0]),
+            "difference": observed,
+            "p_permutation": _p_value(null, observed),
+            "ci_low": low,
+            "ci_high": high,
+            "n_resamples": n_resamples,
+        })
+    return pd.DataFrame(rows)
+
+
+def power(data, effect, sample_sizes, contrast="group_x_trial", measure="avg_incongruent", alpha=0.05,
+          n_sims=10_000, seed=0, batch_size=BATCH_SIZE, executor=None):
+    """Simulated power of a contrast to detect a mean difference of effect seconds.
+
+    Returns a DataFrame with the power for each per-group sample size.
+    """
+    kind, samples = contrasts(data, measure)[contrast]
+    submit = executor.submit if executor is not None else _run_now
+    jobs = {}
+    for n_per_group in sample_sizes:
+        seed_sequence = np.random.SeedSequence([seed, n_per_group])
+        jobs[n_per_group] = [submit(power_batch, kind, samples, effect, n_per_group, alpha, size, child)
+                             for size, child in _batches(n_sims, batch_size, seed_sequence)]
+    return pd.DataFrame([{"contrast": contrast, "measure": measure, "effect": effect, "n_per_group": n,
+                          "power": sum(job.result() for job in jobs[n]) / n_sims}
+                         for n in sample_sizes])
+
+
+class _Done:
+    """Result holder with the Future interface, for running batches in-process."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def _run_now(function, *args):
+    return _Done(function(*args))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Permutation tests, bootstrap CIs and power for the group x trial contrasts.")
+    parser.add_argument("input", nargs="?", default="reaction_times.csv")
+    parser.add_argument("--measure", default="avg_incongruent",
+                        choices=["avg_incongruent", "avg_congruent", "acc_incongruent", "acc_congruent"])
+    parser.add_argument("--resamples", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (1 runs in-process)")
+    parser.add_argument("--power-effect", type=float, default=None, help="effect in seconds for the power analysis")
+    parser.add_argument("--power-n", type=int, nargs="+", default=[10, 20, 40, 80], help="per-group sample sizes")
+    parser.add_argument("--power-contrast", choices=CONTRASTS, default="group_x_trial")
+    parser.add_argument("--output", default=None, help="CSV for the contrast table")
+    args = parser.parse_args()
+
+    data = score(pd.read_csv(args.input))
+    executor = ProcessPoolExecutor(args.workers) if args.workers and args.workers > 1 else None
+    try:
+        results = infer(data, args.measure, args.resamples, args.seed, executor=executor)
+        print(results.to_string(index=False))
+        if args.output:
+            results.to_csv(args.output, index=False)
+        if args.power_effect is not None:
+            print()
+            print(power(data, args.power_effect, args.power_n, args.power_contrast, args.measure,
+                        seed=args.seed, executor=executor).to_string(index=False))
+    finally:
+        if executor is not None:
+            executor.shutdown()
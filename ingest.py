@@ -0,0 +1,203 @@
+import argparse
+import ast
+import csv
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from session_store import N_TRIALS, SUMMARY_COLUMNS, wide_header
+
+FIXED_COLUMNS = ["id", "trial", "gender", "group", "age", "time"]
+CORRECTNESS = {"Correct": "Correct", "True": "Correct", "Incorrect": "Incorrect", "False": "Incorrect"}
+
+
+def detect_schema(header):
+    """Name the layout a station file was written in, from its header.
+
+    "wide" is the curated trial_typeN/rtN/accuracyN layout (also written by
+    session_store.py export), "word" the reaction_time_N/correctness_N
+    layout of test.py, "stroop" the numbered RT columns of stroop.py and
+    "reaction" the single list column of reaction.py.
+    """
+    if "trial_type1" in header and "rt1" in header:
+        return "wide"
+    if "trial_type" in header and "reaction_time_1" in header:
+        return "word"
+    if "trial_type" in header and "correctness_1" in header:
+        return "stroop"
+    if len(header) == 6 and header[5].startswith("["):
+        return "reaction"
+    return None
+
+
+def _cell(value):
+    """A cell as written by the canonical layout: None and NaN become empty."""
+    if value is None or value in ("None", "nan"):
+        return ""
+    return str(value)
+
+
+def _trial_types(value):
+    # stroop.py wrote a list of bools, test.py a list of "True"/"False" strings
+    return [_cell(item) for item in ast.literal_eval(value)] if value else []
+
+
+def _split_trials(cells):
+    """Split the ragged RT and correctness cells of a stroop.py or test.py row.
+
+    The RT list was padded with None to ten trials while the correctness
+    list was not, so the two are split at the first correctness marker
+    instead of at the header's column count.
+    """
+    for i, value in enumerate(cells):
+        if value in CORRECTNESS:
+            return cells[:i], cells[i:]
+    return cells, []
+
+
+def canonical_row(fixed, trial_types, rts, accuracy, summary=(), n_trials=N_TRIALS):
+    """One row in the wide_header(n_trials) layout, every cell as a string."""
+    def pad(values):
+        values = [_cell(value) for value in values[:n_trials]]
+        return values + [""] * (n_trials - len(values))
+
+    summary = [_cell(value) for value in summary] or [""] * len(SUMMARY_COLUMNS)
+    return [_cell(value) for value in fixed] + pad(trial_types) + pad(rts) + pad(accuracy) + summary
+
+
+def parse_file(path, n_trials=N_TRIALS):
+    """Read a station file of any known layout.
+
+    Returns (schema, rows) where rows are (task, row) pairs in the
+    canonical layout. The task is "word" for test.py files, "reaction" for
+    reaction.py files, whose rows have empty trial types, accuracies and
+    group, and "stroop" otherwise.
+    """
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return "empty", []
+        schema = detect_schema(header)
+        if schema is None:
+            raise ValueError(f"unknown header {header[:8]}")
+
+        file_trials = sum(1 for name in header if name.startswith("rt"))
+        rows = []
+        for cells in reader:
+            if not cells:
+                continue
+            if schema == "wide":
+                row = dict(zip(header, cells))
+                numbered = range(1, file_trials + 1)
+                rows.append(("stroop", canonical_row(
+                    [row.get(name, "") for name in FIXED_COLUMNS],
+                    [row.get(f"trial_type{i}", "") for i in numbered],
+                    [row.get(f"rt{i}", "") for i in numbered],
+                    [CORRECTNESS.get(row.get(f"accuracy{i}", ""), "") for i in numbered],
+                    [row.get(name, "") for name in SUMMARY_COLUMNS], n_trials)))
+            elif schema == "reaction":
+                rts = ast.literal_eval(cells[5]) if cells[5] else []
+                rows.append(("reaction", canonical_row(
+                    cells[:3] + [""] + cells[3:5], [], rts, [], n_trials=n_trials)))
+            else:
+                rts, correctness = _split_trials(cells[7:])
+                rows.append(("word" if schema == "word" else "stroop", canonical_row(
+                    cells[:6], _trial_types(cells[6]), rts,
+                    [CORRECTNESS[value] for value in correctness], n_trials=n_trials)))
+    return schema, rows
+
+
+def merge(parsed):
+    """Deduplicate parsed files on (task, id, trial), keeping the first occurrence.
+
+    parsed is a list of (path, schema, rows) in input order; a schema of
+    None marks a file that could not be read, with the reason in place of
+    its rows, and is listed in stats["skipped"]. A dict keyed on
+    (task, id, trial) is the hash index, so each row is checked in constant
+    time however many files are merged. Returns ({task: rows}, stats).
+    """
+    index = {}
+    merged = {}
+    stats = {"files": {}, "rows": 0, "duplicates": 0, "conflicts": [], "skipped": []}
+    for path, schema, rows in parsed:
+        if schema is None:
+            stats["skipped"].append((path, rows))
+            continue
+        stats["files"][schema] = stats["files"].get(schema, 0) + 1
+        for task, row in rows:
+            stats["rows"] += 1
+            key = (task, row[0], row[1])
+            if key in index:
+                stats["duplicates"] += 1
+                if index[key] != row:
+                    stats["conflicts"].append((task, row[0], row[1], path))
+                continue
+            index[key] = row
+            merged.setdefault(task, []).append(row)
+    return merged, stats
+
+
+def _parse(path):
+    # A file that cannot be read must not abort the whole merge in the pool
+    try:
+        return (path,) + parse_file(path)
+    except (OSError, ValueError, SyntaxError, KeyError, csv.Error) as error:
+        return path, None, str(error)
+
+
+def ingest(paths, workers=None):
+    """Parse station files in worker processes and merge them; see merge()."""
+    if workers == 1:
+        parsed = [_parse(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            parsed = list(executor.map(_parse, paths, chunksize=max(1, len(paths) // 64)))
+    return merge(parsed)
+
+
+def write_rows(path, rows, n_trials=N_TRIALS):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(wide_header(n_trials))
+        writer.writerows(rows)
+
+
+def expand_paths(patterns):
+    """Files named on the command line; directories contribute every CSV below them."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, "**", "*.csv"), recursive=True)))
+        else:
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge station CSVs of every layout into the wide reaction_times.csv layout.")
+    parser.add_argument("inputs", nargs="+", help="CSV files, globs or directories")
+    parser.add_argument("--out", default="reaction_times.csv", help="merged Stroop sessions")
+    parser.add_argument("--reaction-out", default="reaction_task.csv", help="merged reaction time task sessions")
+    parser.add_argument("--word-out", default="word_task.csv", help="merged word Stroop (test.py) sessions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    merged, stats = ingest(expand_paths(args.inputs), args.workers)
+    write_rows(args.out, merged.get("stroop", []))
+    if merged.get("reaction"):
+        write_rows(args.reaction_out, merged["reaction"])
+    if merged.get("word"):
+        write_rows(args.word_out, merged["word"])
+    layouts = ", ".join(f"{count} {schema}" for schema, count in sorted(stats["files"].items()))
+    print(f"Read {stats['rows']} rows from {sum(stats['files'].values())} files ({layouts})"
+          + (f", skipped {len(stats['skipped'])}" if stats["skipped"] else ""))
+    print(f"Wrote {len(merged.get('stroop', []))} Stroop sessions to {args.out}"
+          + (f", {len(merged['word'])} word Stroop sessions to {args.word_out}" if merged.get("word") else "")
+          + (f" and {len(merged['reaction'])} reaction time sessions to {args.reaction_out}"
+             if merged.get("reaction") else ""))
+    print(f"Dropped {stats['duplicates']} duplicate (id, trial) rows")
+    for path, reason in stats["skipped"]:
+        print(f"  skipped {path}: {reason}")
+    for task, participant_id, trial, path in stats["conflicts"]:
+        print(f"  conflict: {task} id {participant_id} trial {trial} in {path} differs from the first copy")
@@ -0,0 +1,98 @@
+from collections import deque
+
+import pygame
+
+from timing import now_ns
+
+try:
+    from pynput import keyboard, mouse
+except ImportError:  # Optional: without it events are stamped when they are dequeued
+    keyboard = mouse = None
+
+# Captured presses older than this when their SDL event is handled were not
+# meant for our window (e.g. a click on another application) and are dropped.
+MAX_AGE_NS = 250_000_000
+QUEUE_SIZE = 64
+
+KEY_ALIASES = {"enter": "return", "esc": "escape", "cmd": "left meta"}
+MOUSE_BUTTONS = {"left": 1, "middle": 2, "right": 3}
+
+
+def _pygame_key(key):
+    """pygame key code of a pynput key, or None if pygame has no name for it."""
+    name = getattr(key, "char", None) or getattr(key, "name", None)
+    if name is None:
+        return None
+    try:
+        return pygame.key.key_code(KEY_ALIASES.get(name, name))
+    except ValueError:
+        return None
+
+
+class InputCapture:
+    """Stamps key presses and mouse clicks on the OS input hook thread.
+
+    pygame only sees input when the task thread pumps SDL's queue, which can
+    be behind by a render or a flip. pynput's listener threads receive the
+    same presses as the OS delivers them and stamp them with now_ns(). The
+    stamps are handed over through deques, whose append and popleft are
+    atomic, so neither side ever takes a lock.
+
+    The scheduler passes every input event it dequeues through stamp(),
+    which pairs it with the oldest matching capture and sets timestamp_ns,
+    the attribute TrialClock prefers over the dequeue time. Without pynput,
+    or when no capture matches, events are left untouched.
+    """
+
+    def __init__(self, max_age_ns=MAX_AGE_NS):
+        self.max_age_ns = max_age_ns
+        self._keys = deque(maxlen=QUEUE_SIZE)  # (timestamp_ns, pygame key)
+        self._clicks = deque(maxlen=QUEUE_SIZE)  # (timestamp_ns, pygame button)
+        self._listeners = []
+
+    @property
+    def available(self):
+        return keyboard is not None
+
+    def start(self):
+        """Start the listener threads; returns False if pynput is not installed."""
+        if not self.available or self._listeners:
+            return bool(self._listeners)
+        self._listeners = [keyboard.Listener(on_press=self._on_press), mouse.Listener(on_click=self._on_click)]
+        for listener in self._listeners:
+            listener.daemon = True
+            listener.start()
+        return True
+
+    def stop(self):
+        for listener in self._listeners:
+            listener.stop()
+        self._listeners = []
+
+    def _on_press(self, key):
+        timestamp_ns = now_ns()  # Stamp first, translate afterwards
+        self._keys.append((timestamp_ns, _pygame_key(key)))
+
+    def _on_click(self, x, y, button, pressed):
+        timestamp_ns = now_ns()
+        if pressed:
+            self._clicks.append((timestamp_ns, MOUSE_BUTTONS.get(button.name)))
+
+    def stamp(self, event):
+        """Set timestamp_ns on a KEYDOWN or MOUSEBUTTONDOWN from its captured press."""
+        if event.type == pygame.KEYDOWN:
+            captured, code = self._keys, event.key
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            captured, code = self._clicks, event.button
+        else:
+            return event
+        if getattr(event, "timestamp_ns", None) is not None:
+            return event
+
+        oldest_ns = now_ns() - self.max_age_ns
+        while captured:
+            timestamp_ns, captured_code = captured.popleft()
+            if timestamp_ns >= oldest_ns and captured_code == code:
+                event.timestamp_ns = timestamp_ns
+                break
+        return event
@@ -0,0 +1,269 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+STATS_PATH = "live_stats.json"
+REFRESH_S = 5.0  # Seconds between rewrites of the summary file
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+class QuantileSketch:
+    """Log-bucketed histogram of positive values with a bounded relative error.
+
+    A value x goes to bucket ceil(log(x) / log(gamma)), so every quantile is
+    within relative_accuracy of the true one and memory grows with the
+    log of the value range, not with the number of values (a few hundred
+    buckets cover 10 ms to 10 s).
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0
+
+    def add(self, value):
+        if value <= 0:
+            return  # Reaction times are positive; anything else is counted as invalid by RunningStats
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)  # Middle of the bucket
+        return None
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += other.count
+
+    def state(self):
+        return {"relative_accuracy": self.relative_accuracy, "buckets": self.buckets}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state["relative_accuracy"])
+        for key, count in state["buckets"].items():
+            sketch.buckets[int(key)] = count  # JSON keys come back as strings
+        sketch.count = sum(sketch.buckets.values())
+        return sketch
+
+
+class RunningStats:
+    """Welford mean and variance, accuracy, range and quantiles of one cell, updated per trial in O(1)."""
+
+    __slots__ = ("n", "mean", "m2", "n_correct", "n_scored", "n_invalid", "min", "max", "sketch")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.n_correct = 0
+        self.n_scored = 0  # Trials with a correctness flag
+        self.n_invalid = 0  # Missing or non-positive RTs
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def add(self, rt, correct=None):
+        if correct is not None:
+            self.n_scored += 1
+            self.n_correct += bool(correct)
+        if rt is None or not rt > 0:
+            self.n_invalid += 1
+            return
+        self.n += 1
+        delta = rt - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (rt - self.mean)
+        self.min = min(self.min, rt)
+        self.max = max(self.max, rt)
+        self.sketch.add(rt)
+
+    def merge(self, other):
+        """Combine with the stats of another station or day (Chan et al.'s parallel update)."""
+        n = self.n + other.n
+        if other.n:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.n * other.n / n
+            self.mean += delta * other.n / n
+        self.n = n
+        self.n_correct += other.n_correct
+        self.n_scored += other.n_scored
+        self.n_invalid += other.n_invalid
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def sd(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+    @property
+    def accuracy(self):
+        return self.n_correct / self.n_scored if self.n_scored else None
+
+    def state(self):
+        return {"n": self.n, "mean": self.mean, "m2": self.m2, "n_correct": self.n_correct,
+                "n_scored": self.n_scored, "n_invalid": self.n_invalid,
+                "min": self.min if self.n else None, "max": self.max if self.n else None,
+                "sketch": self.sketch.state()}
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        for name in ("n", "mean", "m2", "n_correct", "n_scored", "n_invalid"):
+            setattr(stats, name, state[name])
+        if stats.n:
+            stats.min, stats.max = state["min"], state["max"]
+        stats.sketch = QuantileSketch.from_state(state["sketch"])
+        return stats
+
+
+def _congruency(congruent):
+    if congruent is None:
+        return "none"  # The reaction time task has no congruency
+    return "congruent" if congruent else "incongruent"
+
+
+class LiveStats:
+    """Running statistics per task x group x trial x congruency over every recorded trial.
+
+    The trial writer calls add() for each trial it stores, and refresh()
+    after each commit; the state is rewritten to a JSON file at most every
+    refresh_s seconds and reloaded on the next start of the same day, so a
+    collection day can be monitored without rescanning the session data.
+    """
+
+    def __init__(self, path=STATS_PATH, refresh_s=REFRESH_S):
+        self.path = path
+        self.refresh_s = refresh_s
+        self.cells = {}
+        self._written = time.monotonic()
+        self._dirty = False
+
+    def add(self, task, group, trial, rt, congruent=None, correct=None):
+        key = (task, str(group), int(trial), _congruency(congruent))
+        if key not in self.cells:
+            self.cells[key] = RunningStats()
+        self.cells[key].add(rt, correct)
+        self._dirty = True
+
+    def summary(self):
+        """One dict per cell with n, mean, sd, accuracy, range and QUANTILES, sorted by cell."""
+        rows = []
+        for (task, group, trial, congruency), stats in sorted(self.cells.items()):
+            row = {"task": task, "group": group, "trial": trial, "congruency": congruency,
+                   "n": stats.n, "invalid": stats.n_invalid, "mean": stats.mean if stats.n else None,
+                   "sd": stats.sd, "accuracy": stats.accuracy,
+                   "min": stats.min if stats.n else None, "max": stats.max if stats.n else None}
+            for q in QUANTILES:
+                row[f"p{round(q * 100)}"] = stats.sketch.quantile(q)
+            rows.append(row)
+        return rows
+
+    def refresh(self, force=False):
+        """Write the state and summary if anything changed and refresh_s has passed."""
+        if self._dirty and (force or time.monotonic() - self._written >= self.refresh_s):
+            self.save()
+
+    def save(self):
+        state = {"updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+                 "cells": [{"key": list(key), "stats": stats.state()} for key, stats in self.cells.items()],
+                 "summary": self.summary()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp, self.path)  # Readers never see a half-written file
+        self._written = time.monotonic()
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path=STATS_PATH, refresh_s=REFRESH_S):
+        """Resume from today's state file, or start empty.
+
+        A state file written on an earlier day is archived (see archive())
+        so every collection day starts from zero.
+        """
+        stats = cls(path, refresh_s)
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state["updated"][:10] == time.strftime("%Y-%m-%d"):
+                for cell in state["cells"]:
+                    stats.cells[tuple(cell["key"])] = RunningStats.from_state(cell["stats"])
+            else:
+                archive(path)
+        return stats
+
+
+def archive(path=STATS_PATH):
+    """Move the state file aside, named after its last update; returns the new path, or None if there is none.
+
+    live_stats.json updated at 2024-05-02 17:30:05 becomes
+    live_stats_2024-05-02_173005.json, so a reset during the day does not
+    overwrite the archive of that day's earlier statistics.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        updated = json.load(f)["updated"]
+    root, extension = os.path.splitext(path)
+    archived = f"{root}_{updated.replace(' ', '_').replace(':', '')}{extension}"
+    os.replace(path, archived)
+    return archived
+
+
+def format_summary(rows):
+    """The summary as a fixed-width text table, RTs in milliseconds."""
+    header = f"{'task':<9}{'group':<10}{'trial':>5} {'congruency':<12}{'n':>6}{'bad':>5}" \
+             f"{'mean':>8}{'sd':>8}{'acc':>7}{'p50':>8}{'p90':>8}{'p99':>8}"
+    lines = [header]
+
+    def ms(value):
+        return f"{value * 1000:8.0f}" if value is not None else f"{'-':>8}"
+
+    for row in rows:
+        accuracy = f"{row['accuracy']:7.2f}" if row["accuracy"] is not None else f"{'-':>7}"
+        lines.append(f"{row['task']:<9}{row['group']:<10}{row['trial']:>5} {row['congruency']:<12}"
+                     f"{row['n']:>6}{row['invalid']:>5}{ms(row['mean'])}{ms(row['sd'])}{accuracy}"
+                     f"{ms(row['p50'])}{ms(row['p90'])}{ms(row['p99'])}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the live per-group statistics of today's sessions.")
+    parser.add_argument("path", nargs="?", default=STATS_PATH)
+    parser.add_argument("--watch", type=float, default=None, metavar="SECONDS", help="redraw every SECONDS")
+    parser.add_argument("--reset", action="store_true", help="archive the current statistics and start a new day")
+    args = parser.parse_args()
+
+    if args.reset:
+        archived = archive(args.path)
+        print(f"Statistics moved to {archived}" if archived else f"No statistics in {args.path} to reset")
+        sys.exit()
+
+    while True:
+        if os.path.exists(args.path):
+            with open(args.path) as f:
+                state = json.load(f)
+            text = f"Updated {state['updated']}\n" + format_summary(state["summary"])
+        else:
+            text = f"No statistics in {args.path} yet"
+        if args.watch is None:
+            print(text)
+            break
+        print("\033[2J\033[H" + text, flush=True)  # Clear the terminal and redraw
+        time.sleep(args.watch)
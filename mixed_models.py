@@ -0,0 +1,133 @@
+import argparse
+import itertools
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+
+from expand_long import expand_chunk
+
+CUTOFFS = [2.0, 2.5, 3.0, None]  # RT cutoffs in seconds; None keeps every trial
+SUBSETS = ["incongruent", "congruent", "all"]
+RANDOM_EFFECTS = {
+    "intercept": ["intercept"],  # (1 | id)
+    "trial": ["intercept", "trial2"],  # (trial | id)
+}
+TERMS = ["intercept", "trial2", "exercise", "trial2:exercise"]
+
+_design = None  # Set in each worker by _init_worker
+
+
+class Design:
+    """Arrays shared by every fit of the grid, built once from the long table.
+
+    The fixed-effects matrix of log_rt ~ trial * group (control and trial 1
+    as baseline, as in expanded_model.R) and the random-effects columns are
+    computed once; each fit only selects rows.
+    """
+
+    def __init__(self, long):
+        trial2 = (long["trial"].astype(int) == 2).to_numpy(dtype=np.float64)
+        exercise = (long["group"] == "exercise").to_numpy(dtype=np.float64)
+        self.columns = {
+            "intercept": np.ones(len(long)),
+            "trial2": trial2,
+            "exercise": exercise,
+            "trial2:exercise": trial2 * exercise,
+        }
+        self.exog = np.column_stack([self.columns[term] for term in TERMS])
+        self.rt = long["rt"].to_numpy(dtype=np.float64)
+        self.log_rt = np.log(self.rt)
+        self.ids = long["id"].to_numpy()
+        self.congruent = (long["trial_type"] == "Congruent").to_numpy()
+
+    def mask(self, subset, cutoff):
+        keep = np.ones(len(self.rt), dtype=bool)
+        if subset == "incongruent":
+            keep &= ~self.congruent
+        elif subset == "congruent":
+            keep &= self.congruent
+        if cutoff is not None:
+            keep &= self.rt < cutoff  # remove_large_vals in expanded_model.R
+        return keep
+
+
+def fit(design, subset, cutoff, random_effects, reml=True):
+    """Fit one cell of the grid and return its tidy rows, one per fixed-effect term."""
+    keep = design.mask(subset, cutoff)
+    exog_re = np.column_stack([design.columns[name][keep] for name in RANDOM_EFFECTS[random_effects]])
+    cell = {"subset": subset, "cutoff": cutoff, "random_effects": random_effects,
+            "n_obs": int(keep.sum()), "n_ids": len(np.unique(design.ids[keep]))}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # Convergence problems are reported in the table instead
+        try:
+            model = sm.MixedLM(design.log_rt[keep], design.exog[keep], groups=design.ids[keep],
+                               exog_re=exog_re)
+            result = model.fit(reml=reml)
+        except (np.linalg.LinAlgError, ValueError) as error:
+            return [dict(cell, term=None, error=str(error))]
+
+    fe = result.fe_params
+    se = result.bse_fe
+    z = fe / se
+    p_values = result.pvalues[:len(TERMS)]
+    ci = result.conf_int()[:len(TERMS)]
+    return [dict(cell, term=term, estimate=fe[i], std_error=se[i], z=z[i], p_value=p_values[i],
+                 ci_low=ci[i, 0], ci_high=ci[i, 1], ratio=np.exp(fe[i]),
+                 log_likelihood=result.llf, converged=bool(result.converged), error=None)
+            for i, term in enumerate(TERMS)]
+
+
+def _init_worker(long):
+    global _design
+    _design = Design(long)
+
+
+def _fit_cell(subset, cutoff, random_effects):
+    return fit(_design, subset, cutoff, random_effects)
+
+
+def grid(long, cutoffs=CUTOFFS, subsets=SUBSETS, random_effects=tuple(RANDOM_EFFECTS), workers=None):
+    """Fit log_rt ~ trial * group for every combination of cutoff, subset and random-effect structure.
+
+    Each worker process builds the Design once and fits its share of the
+    cells. Returns one tidy DataFrame with a row per cell and term.
+    """
+    cells = list(itertools.product(subsets, cutoffs, random_effects))
+    if workers == 1:
+        design = Design(long)
+        results = [fit(design, *cell) for cell in cells]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(long,)) as executor:
+            results = list(executor.map(_fit_cell, *zip(*cells)))
+    return pd.DataFrame([row for rows in results for row in rows])
+
+
+def load_long(path, accuracy="correct"):
+    """Trial rows of every congruency from a wide CSV, as read by expanded_model.R."""
+    return expand_chunk(pd.read_csv(path), congruency="all", accuracy=accuracy)
+
+
+def _cutoff(value):
+    return None if value.lower() == "none" else float(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the log-RT mixed model over a grid of outlier cutoffs, subsets and random effects.")
+    parser.add_argument("input", nargs="?", default="reaction_times.csv", help="wide session CSV")
+    parser.add_argument("--cutoffs", type=_cutoff, nargs="+", default=CUTOFFS, help='seconds, or "none"')
+    parser.add_argument("--subsets", nargs="+", choices=SUBSETS, default=SUBSETS)
+    parser.add_argument("--random", nargs="+", choices=list(RANDOM_EFFECTS), default=list(RANDOM_EFFECTS))
+    parser.add_argument("--accuracy", choices=["correct", "incorrect", "all"], default="correct")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="lmm_grid.csv")
+    args = parser.parse_args()
+
+    results = grid(load_long(args.input, args.accuracy), args.cutoffs, args.subsets, args.random, args.workers)
+    results.to_csv(args.output, index=False)
+    interaction = results[results["term"] == "trial2:exercise"]
+    print(interaction[["subset", "cutoff", "random_effects", "n_obs", "estimate", "p_value", "converged"]]
+          .to_string(index=False))
@@ -0,0 +1,286 @@
+import argparse
+import hashlib
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")  # Render to files only, no display or Jupyter kernel needed
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+import statsmodels.api as sm
+from scipy import stats
+
+from expand_long import expand_chunk
+from mixed_models import RANDOM_EFFECTS, TERMS, Design
+from scoring import score
+
+PLOTS_DIR = "Plots"
+MANIFEST = ".plot_hashes.json"
+VERSION = 2  # Bump when a render function changes, to redraw everything
+GROUPS = [("exercise", "Exercise", 3, 8), ("control", "Control", 2, 7)]  # name, label, palette pre/post
+QQ_NAMES = {"exercise": "exer", "control": "cont"}
+RANDOM_FORMULAS = {"intercept": "(1 | id)", "trial": "(trial | id)"}
+
+
+def box_by_group_trial(data, spec, path):
+    """Box plot of a per-session measure for every group before and after."""
+    palette = sns.color_palette("colorblind")
+    parts = []
+    colors = []
+    for trial, when in ((1, "Pre"), (2, "Post")):
+        for group, label, pre, post in GROUPS:
+            subset = data[(data["group"] == group) & (data["trial"] == trial)]
+            parts.append(subset.assign(trial_group=f"{label} - {when}"))
+            colors.append(palette[pre if trial == 1 else post])
+    fig, ax = plt.subplots(figsize=(12, 8))
+    sns.boxplot(x="trial_group", y=spec["measure"], hue="trial_group", data=pd.concat(parts), palette=colors,
+                showmeans=True, ax=ax)
+    ax.set_title(spec["title"], fontsize=16)
+    ax.set_xlabel("Group and Trial", fontsize=12)
+    ax.set_ylabel("Reaction Time (s)", fontsize=12)
+    ax.tick_params(axis="x", rotation=30)
+    fig.tight_layout()
+    fig.savefig(path, format="png", dpi=spec["dpi"])
+
+
+def lines_by_group(data, spec, path):
+    """Mean of a measure per trial, one line per group."""
+    fig, ax = plt.subplots()
+    for group, label, _, _ in GROUPS:
+        means = [data[(data["group"] == group) & (data["trial"] == trial)][spec["measure"]].mean() for trial in (1, 2)]
+        ax.plot([1, 2], means, marker="o", label=label)
+    ax.set_xlabel("Trial")
+    ax.set_xticks([1, 2])
+    ax.set_ylabel("Reaction time (s)")
+    ax.set_title(spec["title"])
+    ax.legend()
+    fig.savefig(path, format="png", dpi=spec["dpi"])
+
+
+def distribution_by_trial(data, spec, path):
+    """KDE of a measure for both groups, one panel per trial."""
+    palette = sns.color_palette("colorblind")
+    fig, ax = plt.subplots(1, 2, figsize=(12, 6))
+    for i, trial in enumerate((1, 2)):
+        for group, label, pre, _ in GROUPS:
+            values = data[(data["group"] == group) & (data["trial"] == trial)][spec["measure"]]
+            sns.kdeplot(values, ax=ax[i], color=palette[pre], label=label)
+        ax[i].set_title(f"{spec['title']} Trial {trial}")
+        ax[i].legend()
+    fig.tight_layout()
+    fig.savefig(path, format="png", dpi=spec["dpi"])
+
+
+def qq_log_rt(long, spec, path):
+    """Normal QQ plot of log RTs of one group and trial, with the Shapiro-Wilk p-value."""
+    subset = long[(long["group"] == spec["group"]) & (long["trial"] == spec["trial"]) & (long["rt"] < spec["cutoff"])]
+    log_rt = np.log(subset["rt"].to_numpy())
+    fig, ax = plt.subplots()
+    sm.qqplot(log_rt, line="s", ax=ax)
+    ax.set_title(spec["title"])
+    ax.legend([f"p-val = {stats.shapiro(log_rt).pvalue:.7f}"], loc="upper left")
+    fig.savefig(path, format="png", dpi=spec["dpi"])
+
+
+def fit_lmm(long, spec):
+    """Fit log_rt ~ trial * group with spec's random effects on the trials below the cutoff.
+
+    Returns the rows that went into the fit and the MixedLM result.
+    """
+    design = Design(long)
+    keep = design.mask("incongruent", spec["cutoff"])
+    exog = pd.DataFrame(design.exog[keep], columns=TERMS)  # Named, for the summary table
+    exog_re = pd.DataFrame({name: design.columns[name][keep] for name in RANDOM_EFFECTS[spec["random_effects"]]})
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        result = sm.MixedLM(pd.Series(design.log_rt[keep], name="log_rt"), exog, groups=design.ids[keep],
+                            exog_re=exog_re).fit()
+    return long[keep], result
+
+
+def lmm_residuals(long, spec, path):
+    """Residuals of a log-RT model: against fitted values, per group x trial, or as a QQ plot."""
+    rows, result = fit_lmm(long, spec)
+    residuals = np.asarray(result.resid)
+    fitted = np.asarray(result.fittedvalues)
+    if spec["kind"] == "facets":
+        fig, axes = plt.subplots(2, 2, sharex=True, sharey=True, figsize=(8, 6))
+        for row, trial in enumerate((1, 2)):
+            for column, (group, _, _, _) in enumerate(sorted(GROUPS)):
+                cell = ((rows["group"] == group) & (rows["trial"].astype(int) == trial)).to_numpy()
+                ax = axes[row, column]
+                ax.scatter(fitted[cell], residuals[cell], s=8, alpha=0.5, color="black")
+                ax.axhline(0, color="red")
+                ax.set_title(f"{group}, trial {trial}", fontsize=10)
+        fig.supxlabel("fitted")
+        fig.supylabel("residuals")
+        fig.suptitle(spec["title"])
+        fig.savefig(path, format="png", dpi=spec["dpi"])
+        return
+    fig, ax = plt.subplots()
+    if spec["kind"] == "qq":
+        sm.qqplot(residuals, line="s", ax=ax)
+        ax.legend([f"p-val = {stats.shapiro(residuals).pvalue:.3g}"], loc="upper left")
+    else:
+        ax.scatter(fitted, residuals, s=8, alpha=0.5)
+        ax.axhline(0, color="red")
+        ax.set_xlabel("Fitted Values")
+        ax.set_ylabel("Residuals")
+    ax.set_title(spec["title"])
+    fig.savefig(path, format="png", dpi=spec["dpi"])
+
+
+def lmm_predictions(long, spec, path):
+    """Observed log RTs per trial with each participant's fitted line, coloured by participant or group.
+
+    Coloured by group, the group means are joined by a solid line, as the
+    stat_smooth trends of expanded_model.R.
+    """
+    rows, result = fit_lmm(long, spec)
+    data = pd.DataFrame({"id": rows["id"].to_numpy(), "group": rows["group"].to_numpy(),
+                         "trial": rows["trial"].astype(int).to_numpy(), "log_rt": np.log(rows["rt"].to_numpy()),
+                         "predicted": np.asarray(result.fittedvalues)})
+    keys = sorted(data[spec["color"]].unique(), key=str)
+    palette = dict(zip(keys, sns.color_palette("husl", len(keys))))
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for key, points in data.groupby(spec["color"]):
+        ax.scatter(points["trial"], points["log_rt"], s=10, alpha=0.6, color=palette[key], label=str(key))
+    for participant, lines in data.groupby("id"):
+        line = lines.groupby("trial")["predicted"].mean()
+        ax.plot(line.index, line.to_numpy(), linestyle="--", alpha=0.7, color=palette[lines[spec["color"]].iloc[0]])
+    if spec["color"] == "group":
+        for group, points in data.groupby("group"):
+            means = points.groupby("trial")["log_rt"].mean()
+            ax.plot(means.index, means.to_numpy(), linewidth=3, color=palette[group])
+    ax.set_xticks([1, 2])
+    ax.set_xlim(0.5, 2.5)
+    ax.set_xlabel("Trial")
+    ax.set_ylabel("Log Reaction Time")
+    ax.legend(title=spec["color"], fontsize=7, ncol=1 if spec["color"] == "group" else 3,
+              loc="upper left", bbox_to_anchor=(1, 1))
+    if spec.get("title"):
+        ax.set_title(spec["title"])
+    fig.tight_layout()
+    fig.savefig(path, format="png", dpi=spec["dpi"])
+
+
+def lmm_summary(long, spec, path):
+    """The fitted model's summary table as an image, like the console output saved from R."""
+    _, result = fit_lmm(long, spec)
+    text = f"Formula: log_rt ~ trial * group + {RANDOM_FORMULAS[spec['random_effects']]}\n\n{result.summary()}"
+    fig = plt.figure(figsize=(9, 6))
+    fig.text(0.01, 0.99, text, family="monospace", fontsize=8, va="top")
+    fig.savefig(path, format="jpeg", dpi=spec["dpi"])
+
+
+def figures(dpi=300, cutoff=2.5):
+    """Every figure of the report as {relative path: (render, input name, spec)}."""
+    result = {
+        "boxPlots_very_high_view.png": (box_by_group_trial, "scored", {
+            "measure": "avg_incongruent", "title": "RT of Incongruent by Group and Trial"}),
+        "lines_very_high_view.png": (lines_by_group, "scored", {
+            "measure": "avg_incongruent", "title": "Reaction time Incongruent by group and trial"}),
+        "distribution_very_high_view.png": (distribution_by_trial, "scored", {
+            "measure": "avg_incongruent", "title": "RT of Incongruent for Exercise and control group"}),
+    }
+    # Residual and prediction plots of expanded_model.R, for (1 | id) and (trial | id)
+    lmm = {"intercept": {
+        "LLM_Plots/LLM_Plot1.png": (lmm_predictions, {"color": "id"}),
+        "LLM_Plots/LMM_plot2.png": (lmm_predictions, {
+            "color": "group", "title": "Reaction Time Across Trials by Group"}),
+        "Residual_Plots/res_1.png": (lmm_residuals, {"kind": "fitted", "title": "Residuals vs. Fitted Values"}),
+        "Residual_Plots/res_2.png": (lmm_residuals, {
+            "kind": "facets", "title": "Residuals vs. Fitted Values by Group and Trial"}),
+        "Residual_Plots/res_3.png": (lmm_residuals, {"kind": "qq", "title": "LLM residuals - QQ plot"}),
+        "QQ_Plots/QQ_Plot_LMM1_residuals.png": (lmm_residuals, {"kind": "qq", "title": "LLM residuals - QQ plot"}),
+        "QQ_Plots/QQ_residualPlot_LMM1.png": (lmm_residuals, {"kind": "qq", "title": "LLM residuals - QQ plot"}),
+    }, "trial": {
+        "Residual_Plots/rand_tr_plot_2.png": (lmm_predictions, {
+            "color": "group", "title": "Reaction Time Across Trials by Group"}),
+        "Residual_Plots/rand_tr_plot_3.png": (lmm_residuals, {"kind": "qq", "title": "LLM residuals - QQ plot"}),
+        # Named as the R console screenshot it replaces
+        "LMM_RandTrial/fb62b9f6-f53c-45e1-bc04-7dbe5c954d5b.jpeg": (lmm_summary, {}),
+    }}
+    for random_effects, plots in lmm.items():
+        for name, (render, spec) in plots.items():
+            result[name] = (render, "long", dict(spec, cutoff=cutoff, random_effects=random_effects))
+    for group, label, _, _ in GROUPS:
+        for trial in (1, 2):
+            result[f"QQ_Plots/qq_{QQ_NAMES[group]}_tr{trial}.png"] = (qq_log_rt, "long", {
+                "group": group, "trial": trial, "cutoff": cutoff,
+                "title": f"QQplot for log transformed {group} tr{trial}"})
+    for _, _, spec in result.values():
+        spec["dpi"] = dpi
+    return result
+
+
+def inputs(wide):
+    """The data frames figures are drawn from: scored sessions and long correct incongruent trials."""
+    scored = score(wide)
+    scored = scored[scored["avg_incongruent"] != 0.0]  # Sessions without a correct incongruent trial
+    return {"scored": scored, "long": expand_chunk(wide)}
+
+
+def figure_hash(frame, render, spec):
+    """Hash of a figure's input data, render function and spec."""
+    digest = hashlib.sha256(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    digest.update(json.dumps([VERSION, render.__name__, spec], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _render(render, frame, spec, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    render(frame, spec, path)
+    plt.close("all")
+    return path
+
+
+def render_all(wide, directory=PLOTS_DIR, workers=None, force=False, **options):
+    """Render every figure whose input or spec changed since the last run, in a process pool.
+
+    Returns the list of paths that were redrawn.
+    """
+    frames = inputs(wide)
+    manifest_path = os.path.join(directory, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    todo = {}
+    for name, (render, source, spec) in figures(**options).items():
+        path = os.path.join(directory, name)
+        digest = figure_hash(frames[source], render, spec)
+        if manifest.get(name) != digest or not os.path.exists(path):
+            todo[name] = (render, frames[source], spec, path, digest)
+
+    if todo:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = {name: executor.submit(_render, *job[:4]) for name, job in todo.items()}
+            for name, future in futures.items():
+                future.result()
+                manifest[name] = todo[name][4]
+        os.makedirs(directory, exist_ok=True)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    return [job[3] for job in todo.values()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the report figures into the Plots directory.")
+    parser.add_argument("input", nargs="?", default="reaction_times.csv", help="wide session CSV")
+    parser.add_argument("--out", default=PLOTS_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--cutoff", type=float, default=2.5, help="RT cutoff (s) for the QQ and residual plots")
+    parser.add_argument("--force", action="store_true", help="redraw every figure")
+    args = parser.parse_args()
+
+    drawn = render_all(pd.read_csv(args.input), args.out, args.workers, args.force, dpi=args.dpi, cutoff=args.cutoff)
+    print(f"Rendered {len(drawn)} figures" + "".join(f"\n  {path}" for path in drawn))
@@ -1,10 +1,17 @@
 import pygame
-import random
-import time
 import sys
-import csv
 from datetime import datetime
 
+from calibration import latency_correction, load_profile, refresh_ns
+from input_capture import InputCapture
+from scheduler import TrialScheduler, is_key
+from session_store import open_store
+from stimulus_cache import SurfaceCache
+from telemetry import TrialTelemetry
+from timing import TrialClock, now_ns
+from trial_plan import make_reaction_plan
+from trial_writer import TrialWriter
+
 # Define colors
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -13,67 +20,81 @@ RED = (255, 0, 0)
 
 
 class ReactionTimeTest():
-    def __init__(self):
+    def __init__(self, store=None, writer=None, capture=None):
         pygame.init()
         self.font = pygame.font.Font(None, 90)
         self.small_font = pygame.font.Font(None, 40)
         self.screen_width = 1500
         self.screen_height = 800
+        self.stimulus_y = self.screen_height / 2  # Centre of the circle, px from the top
         # Set window
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         pygame.display.set_caption("Reaction Time Test")
+        self.clock = TrialClock()
+        self.capture = capture or InputCapture()  # Stamps input on its own thread when pynput is installed
+        self.capture.start()
+        self.scheduler = TrialScheduler(capture=self.capture)
+        self.store = store or open_store()
+        self.writer = writer or TrialWriter(self.store.path)
+        self.station_profile = load_profile()  # None until calibration.py was run on this station
+        self.cache = SurfaceCache()
+        # run_session.py --profile sets telemetry.profile to profile every block
+        self.telemetry = TrialTelemetry(measured_refresh_ns=refresh_ns(self.station_profile))
 
     def check_if_exists(self, id, trial):
-        """Check if the given id and trial already exists in the CSV file."""
-        try:
-            with open("reaction_times.csv", "r") as f:
-                reader = csv.reader(f)
-                header = next(reader)  # Read the header
-
-                # Iterate over each row in the CSV
-                for row in reader:
-                    if row[0] == str(id) and int(row[1]) == trial:
-                        print(f"ID {id} and Trial {trial} already exist.")  # Print statement
-                        return True  # Found matching ID and trial
-        except FileNotFoundError:
-             return False  
+        """Check if the given id and trial already exists in the session store."""
+        if self.store.exists(id, trial, task="reaction"):
+            print(f"ID {id} and Trial {trial} already exist.")  # Print statement
+            return True  # Found matching ID and trial
         return False  # ID and trial do not exist
     
     def draw_text(self,text, font, color, x, y):
         """Render text on screen"""
-        screen_text = font.render(text, True, color)
-        text_rect = screen_text.get_rect(center=(x, y))
-        self.screen.blit(screen_text, text_rect)
+        with self.telemetry.draw():
+            screen_text = self.cache.text(font, text, color)
+            text_rect = screen_text.get_rect(center=(x, y))
+            self.screen.blit(screen_text, text_rect)
     
 
-    def save_reaction_times(self, reaction_times, id, trial, gender, age, current_time):
-        """Save reaction times to a CSV file, appending new data"""
-
-        with open("reaction_times.csv", "a", newline='') as f:
-            writer = csv.writer(f)
-            # If the file is empty, write the header
-            if f.tell() == 0:  
-                tries = [i for i in range(1,11)]
-                writer.writerow(["id", "trial", "gender", "age", "time", tries]) 
-
-            
-            reaction_times = reaction_times + [None] * (11 - len(reaction_times))  # Fill the rest with None
-            writer.writerow([id, trial, gender, age, current_time, reaction_times])
-
-    def reaction_time_test(self, id, trial, gender, group, age, current_time, practice=False):
-        """Main logic for the reaction time test"""
+    def save_reaction_times(self, complete):
+        """Wait until every streamed reaction time is on disk, marking the session complete if all trials were run"""
+        if self.station_profile is not None:
+            stimulus_y = self.stimulus_y / self.screen_height
+            self.writer.set_correction(latency_correction(self.station_profile, stimulus_y))
+        if complete:
+            self.writer.finish()
+        self.writer.flush()
+
+    def reaction_time_test(self, id, trial, gender, group, age, current_time, practice=False, seed=None):
+        """Main logic for the reaction time test. Returns True if every trial was run."""
         if practice:
             total_trials = 3
         else:
             total_trials = 10
         running = True
-        waiting_for_reaction = False
-        waiting_for_go = False
-        reaction_start_time = 0
         reaction_time = 0
         trial_count = 0
         reaction_times = []
-        too_soon = False  # To handle premature key presses
+        self.clock.reset()
+        is_space = lambda event: is_key(event, pygame.K_SPACE)
+        circle_center = (self.screen_width/2, self.stimulus_y)  # Center of the circle
+        circle_radius = 200  # Radius of the circle
+        if not practice:
+            # Pick up an interrupted session where it stopped, with the same seed
+            resumed = self.store.partial_session("reaction", id, trial)
+            if resumed is not None:
+                seed, trial_count = resumed
+                print(f"Resuming ID {id} and Trial {trial} at trial {trial_count + 1}.")
+
+        # Draw all go-signal delays up front, with spares for restarts after premature presses
+        plan = make_reaction_plan(2 * (total_trials + 1), seed)
+        # Premature presses are not stored, so a resumed session cannot know how many delays
+        # were used; it starts at the first unrecorded trial, which replays the original
+        # delays only if no press came too soon before the interruption
+        attempt = trial_count
+        if not practice:
+            self.writer.begin("reaction", id, trial, gender, group, age, current_time, plan.seed)
+        self.telemetry.begin("reaction", id, trial, practice)
 
         while running and trial_count <= total_trials:
             self.screen.fill(WHITE)
@@ -81,90 +102,79 @@ class ReactionTimeTest():
             #self.draw_text("Reopen the game to reset", self.small_font, BLACK, 150, 300)
             pygame.display.flip()
 
-            # Wait for user input
-            while not waiting_for_go and not waiting_for_reaction and running:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                    elif event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_SPACE and not waiting_for_go and not waiting_for_reaction:
-                            # Display "Wait..." in black
-                            self.screen.fill(WHITE)
-                            circle_center = (self.screen_width/2, self.screen_height/2)  # Center of the circle
-                            circle_radius = 200  # Radius of the circle
-                            pygame.draw.circle(self.screen, RED, circle_center, circle_radius)  # Draw the circle
-                            self.draw_text("Wait...", self.font, WHITE, self.screen_width /2, self.screen_height /2)
-                            pygame.display.flip()
-
-                            # Start random delay before showing "GO!"
-                            random_delay = random.uniform(2, 5)
-                            go_time = time.time() + random_delay
-                            waiting_for_go = True
-
-            # During random delay, check for premature key press
-            while waiting_for_go and not waiting_for_reaction:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                    elif event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_SPACE:
-                            if time.time() < go_time:  # Pressed too soon
-                                too_soon = True
-                                waiting_for_go = False
-                                # Display "Too Soon!" and return to the start
-                                self.screen.fill(WHITE)
-                                self.draw_text("Too Soon!", self.font, RED, self.screen_width /2, self.screen_height /2)
-                                pygame.display.flip()
-                                pygame.time.delay(1000)
-
-                                # Return to "Wait..." screen
-                                self.screen.fill(WHITE)
-                                pygame.draw.circle(self.screen, RED, circle_center, circle_radius)  # Draw the circle
-                                self.draw_text("Wait...", self.font, WHITE, self.screen_width /2, self.screen_height /2)
-                                pygame.display.flip()
-                                pygame.time.delay(2000)  # Display "Wait..." again for 2 seconds
-                                break
-
-                # If the random delay has passed, show "GO!"
-                if time.time() >= go_time:
-                    self.screen.fill(WHITE)
-                    circle_center = (self.screen_width/2, self.screen_height/2)  # Center of the circle
-                    circle_radius = 200  # Radius of the circle
-                    pygame.draw.circle(self.screen, GREEN, circle_center, circle_radius)  # Draw the circle
-                    self.draw_text("GO!", self.font, RED,self.screen_width /2, self.screen_height /2)
-                    pygame.display.flip()
-                    reaction_start_time = time.time()  # Start the timer for reaction time
-                    waiting_for_reaction = True
-                    waiting_for_go = False
+            # Sleep until the user presses space
+            event = self.scheduler.wait(is_space)
+            if event.type == pygame.QUIT:
+                running = False
+                break
+
+            # Display "Wait..." in black
+            self.screen.fill(WHITE)
+            pygame.draw.circle(self.screen, RED, circle_center, circle_radius)  # Draw the circle
+            self.draw_text("Wait...", self.font, WHITE, self.screen_width /2, self.screen_height /2)
+            pygame.display.flip()
+
+            # Start the planned random delay before showing "GO!"
+            go_time = now_ns() + int(plan.delay(attempt) * 1_000_000_000)
+            attempt += 1
+            self.telemetry.schedule(go_time)
+
+            # During random delay, wake up on a premature key press or exactly at go time
+            event = self.scheduler.wait(is_space, deadline_ns=go_time)
+            if event is not None:
+                if event.type == pygame.QUIT:
+                    running = False
+                    break
+
+                # Pressed too soon
+                # Display "Too Soon!" and return to the start
+                self.screen.fill(WHITE)
+                self.draw_text("Too Soon!", self.font, RED, self.screen_width /2, self.screen_height /2)
+                pygame.display.flip()
+                running = self.scheduler.pause(1000)
+
+                # Return to "Wait..." screen
+                self.screen.fill(WHITE)
+                pygame.draw.circle(self.screen, RED, circle_center, circle_radius)  # Draw the circle
+                self.draw_text("Wait...", self.font, WHITE, self.screen_width /2, self.screen_height /2)
+                pygame.display.flip()
+                running = running and self.scheduler.pause(2000)  # Display "Wait..." again for 2 seconds
+                continue
+
+            # The random delay has passed, show "GO!"
+            self.screen.fill(WHITE)
+            pygame.draw.circle(self.screen, GREEN, circle_center, circle_radius)  # Draw the circle
+            self.draw_text("GO!", self.font, RED,self.screen_width /2, self.screen_height /2)
+            self.clock.flip()  # Stimulus onset is stamped right after the flip
 
             # Wait for user's response after "GO!" appears
-            while waiting_for_reaction and running:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                    elif event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_SPACE:
-                            reaction_time = time.time() - reaction_start_time
-                            trial_count += 1
-                            reaction_times.append(reaction_time)
-
-                            # Display the reaction time for 3 seconds
-                            self.screen.fill(WHITE)
-                            #self.draw_text(f"Reaction: {reaction_time:.3f} s", self.small_font, RED, self.screen_width /2, self.screen_height /2)
-                            self.draw_text(f"Trial: {trial_count}", self.small_font, BLACK, self.screen_width /2, self.screen_height /2 )
-                            self.draw_text("Wait for next trial", self.small_font, BLACK, self.screen_width /2, self.screen_height /2 + 50)
-                            pygame.display.flip()
-                            pygame.time.delay(2000)  # Display the result for 3 seconds
-                            waiting_for_reaction = False  # Reset the test
-
-            pygame.display.update()
+            event = self.scheduler.wait(is_space)
+            if event.type == pygame.QUIT:
+                running = False
+                break
+
+            reaction_time = self.clock.record_response(event)
+            trial_count += 1
+            reaction_times.append(reaction_time)
+            self.telemetry.record(trial_count, self.clock, self.scheduler, event)
+            if not practice:
+                self.writer.add(trial_count, reaction_time)  # Streamed by the background writer
+
+            # Display the reaction time for 3 seconds
+            self.screen.fill(WHITE)
+            #self.draw_text(f"Reaction: {reaction_time:.3f} s", self.small_font, RED, self.screen_width /2, self.screen_height /2)
+            self.draw_text(f"Trial: {trial_count}", self.small_font, BLACK, self.screen_width /2, self.screen_height /2 )
+            self.draw_text("Wait for next trial", self.small_font, BLACK, self.screen_width /2, self.screen_height /2 + 50)
+            pygame.display.flip()
+            running = self.scheduler.pause(2000)  # Display the result for 3 seconds
+
         print(reaction_times)
         if not practice:
-            self.save_reaction_times(reaction_times, id, trial, group, gender, age, current_time)
+            self.save_reaction_times(trial_count > total_trials)
+        self.telemetry.end()  # Timing of every trial goes to the sidecar file
 
-        # Print collected data when the test is closed
-        pygame.quit()
         print("Test finished.")
+        return trial_count > total_trials
 
         
         
@@ -180,6 +190,10 @@ if __name__ == "__main__":
     trial = 1
 
     if test.check_if_exists(id,trial) == False:
-        test.reaction_time_test(id, trial, gender, age, current_time, practice)
+        test.reaction_time_test(id, trial, gender, group, age, current_time, practice)
+
+    # Close the window when the test is finished
+    test.capture.stop()
+    pygame.quit()
     
 
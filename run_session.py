@@ -0,0 +1,133 @@
+import argparse
+import json
+from datetime import datetime
+
+import pygame
+
+from collector import CollectorClient, parse_address
+from input_capture import InputCapture
+from live_stats import LiveStats
+from reaction import ReactionTimeTest
+from session_store import open_store
+from stroop import StroopTest
+from test import StroopTest as WordStroopTest
+from trial_writer import TrialWriter
+
+TASKS = {"reaction": ReactionTimeTest, "stroop": StroopTest, "word": WordStroopTest}
+
+# Practice then real block of each task, reaction time test first
+DEFAULT_BLOCKS = [
+    {"task": "reaction", "practice": True},
+    {"task": "reaction", "practice": False},
+    {"task": "stroop", "practice": True},
+    {"task": "stroop", "practice": False},
+]
+PARTICIPANT_FIELDS = ["id", "trial", "gender", "age", "group"]
+
+
+class SessionRunner:
+    """Runs a sequence of task blocks for one participant in a single process.
+
+    pygame, the window, the fonts, the session store, the trial writer and
+    the input capture are set up once; every task is created on first use
+    and reused by later blocks, so moving between blocks costs nothing.
+    Every stored trial updates the day's live statistics (live_stats.py),
+    and with a collector address every finished session is also pushed to
+    the collection server (collector.py). With profile, every block runs
+    under cProfile (see telemetry.py).
+    """
+
+    def __init__(self, collector=None, profile=False):
+        pygame.init()
+        self.store = open_store()
+        self.stats = LiveStats.load()
+        self.collector = CollectorClient(*collector) if collector else None
+        self.writer = TrialWriter(self.store.path, stats=self.stats, collector=self.collector)
+        self.capture = InputCapture()
+        self.capture.start()
+        self.profile = profile
+        self.tasks = {}
+
+    def task(self, name):
+        if name not in self.tasks:
+            self.tasks[name] = TASKS[name](self.store, self.writer, self.capture)
+            self.tasks[name].telemetry.profile = self.profile
+        return self.tasks[name]
+
+    def run_block(self, block, participant, current_time):
+        """Run one block; returns False if the window was closed during it."""
+        name = block["task"]
+        practice = block.get("practice", False)
+        task = self.task(name)
+        pygame.display.set_caption("Reaction Time Test" if name == "reaction" else "Stroop Test")
+        if not practice and task.check_if_exists(participant["id"], participant["trial"]):
+            return True  # Already recorded, move on to the next block
+
+        seed = block.get("seed")
+        if name == "reaction":
+            return task.reaction_time_test(participant["id"], participant["trial"], participant["gender"],
+                                           participant["group"], participant["age"], current_time, practice, seed)
+        return task.run_test(participant["id"], participant["trial"], participant["group"], participant["gender"],
+                             participant["age"], current_time, practice, seed)
+
+    def run(self, blocks, participant):
+        """Run the blocks back to back, stopping if the window is closed."""
+        current_time = datetime.now().strftime("%H:%M:%S")
+        for block in blocks:
+            if not self.run_block(block, participant, current_time):
+                break
+
+    def close(self):
+        self.writer.close()
+        if self.collector is not None:
+            try:
+                self.collector.close()  # Undelivered sessions stay in the spool for next time
+            except Exception as error:
+                print(f"Could not close the collector client: {error!r}")
+        self.store.close()
+        self.capture.stop()
+        pygame.quit()
+
+
+def load_config(path):
+    """Read a JSON config with participant fields, an optional "blocks" list and "profile" flag."""
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run practice and real blocks of the tasks for one participant.")
+    parser.add_argument("--config", default=None, help="JSON file with participant fields and blocks")
+    parser.add_argument("--id", type=int, default=None)
+    parser.add_argument("--trial", type=int, default=None)
+    parser.add_argument("--gender", default=None)
+    parser.add_argument("--age", type=int, default=None)
+    parser.add_argument("--group", default=None, help='"exercise" or "control"')
+    parser.add_argument("--blocks", nargs="+", default=None, metavar="TASK[:practice]",
+                        help="e.g. reaction:practice reaction stroop:practice stroop")
+    parser.add_argument("--collector", type=parse_address, default=None, metavar="HOST:PORT",
+                        help="also push finished sessions to a collection server")
+    parser.add_argument("--profile", action="store_true", help="save a cProfile dump of every block to profiles/")
+    args = parser.parse_args()
+
+    config = load_config(args.config) if args.config else {}
+    participant = {field: config.get(field) for field in PARTICIPANT_FIELDS}
+    for field in PARTICIPANT_FIELDS:
+        if getattr(args, field) is not None:
+            participant[field] = getattr(args, field)  # Command line wins over the config file
+    missing = [field for field in PARTICIPANT_FIELDS if participant[field] is None]
+    if missing:
+        parser.error(f"missing participant fields: {', '.join(missing)}")
+
+    blocks = config.get("blocks", DEFAULT_BLOCKS)
+    if args.blocks:
+        blocks = [{"task": spec.split(":")[0], "practice": spec.endswith(":practice")} for spec in args.blocks]
+    unknown = [block["task"] for block in blocks if block["task"] not in TASKS]
+    if unknown:
+        parser.error(f"unknown tasks: {', '.join(unknown)}")
+
+    runner = SessionRunner(args.collector, args.profile or config.get("profile", False))
+    try:
+        runner.run(blocks, participant)
+    finally:
+        runner.close()
@@ -0,0 +1,82 @@
+import pygame
+
+from timing import now_ns
+
+# Last stretch before a deadline that is busy-waited instead of slept, because
+# SDL's wait timeout only has millisecond granularity and may oversleep.
+SPIN_NS = 2_000_000
+
+
+def is_key(event, key):
+    """True for a KEYDOWN of the given key."""
+    return event.type == pygame.KEYDOWN and event.key == key
+
+
+def is_click(event):
+    """True for any mouse button press."""
+    return event.type == pygame.MOUSEBUTTONDOWN
+
+
+class TrialScheduler:
+    """Event-driven replacement for the pygame.event.get() polling loops.
+
+    The scheduler sleeps inside pygame.event.wait() so the process stays idle
+    until an input event arrives or a deadline is about to pass. The last
+    SPIN_NS before a deadline are spent polling so the wake-up lands on the
+    deadline instead of on SDL's millisecond timer. dequeued_ns is when the
+    last returned event was taken off the queue.
+
+    With an InputCapture, every dequeued event is passed through
+    capture.stamp() so responses carry the time the OS delivered them.
+    """
+
+    def __init__(self, spin_ns=SPIN_NS, capture=None):
+        self.spin_ns = spin_ns
+        self.capture = capture
+        self.dequeued_ns = None
+
+    def wait(self, accept, deadline_ns=None):
+        """Block until an event passes accept(event) or deadline_ns is reached.
+
+        Returns the accepted event, a QUIT event if the window was closed, or
+        None if the deadline passed first. Other events are discarded.
+        """
+        while True:
+            if deadline_ns is None:
+                event = pygame.event.wait()
+            else:
+                remaining = deadline_ns - now_ns()
+                if remaining <= self.spin_ns:
+                    return self._spin(accept, deadline_ns)
+                timeout_ms = (remaining - self.spin_ns) // 1_000_000
+                event = pygame.event.wait(max(int(timeout_ms), 1))
+                if event.type == pygame.NOEVENT:
+                    continue
+            if self.capture is not None:
+                self.capture.stamp(event)
+            if event.type == pygame.QUIT or accept(event):
+                self.dequeued_ns = now_ns()
+                return event
+
+    def _spin(self, accept, deadline_ns):
+        """Poll the queue until the deadline for sub-millisecond wake-up."""
+        while now_ns() < deadline_ns:
+            event = pygame.event.poll()
+            if event.type == pygame.NOEVENT:
+                continue
+            if self.capture is not None:
+                self.capture.stamp(event)
+            if event.type == pygame.QUIT or accept(event):
+                self.dequeued_ns = now_ns()
+                return event
+        return None
+
+    def pause(self, duration_ms):
+        """Input-aware replacement for pygame.time.delay.
+
+        Events arriving during the pause are dropped, except that closing the
+        window ends the pause early. Returns False if the window was closed.
+        """
+        deadline_ns = now_ns() + duration_ms * 1_000_000
+        event = self.wait(lambda event: False, deadline_ns)
+        return event is None
@@ -0,0 +1,65 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+N_TRIALS = 20
+SCORE_COLUMNS = ["avg_incongruent", "avg_congruent", "acc_incongruent", "acc_congruent"]
+
+
+def _as_bool(block, true_value):
+    """Compare a block of cells to its "true" marker, whether it was parsed as bool or str."""
+    if block.dtype == bool:
+        return block
+    return (block == true_value) | (block == str(true_value))
+
+
+def trial_blocks(data, n_trials=N_TRIALS):
+    """Return the wide trial columns as (congruent, rt, correct) arrays of shape (rows, n_trials)."""
+    congruent = data[[f"trial_type{i}" for i in range(1, n_trials + 1)]].to_numpy()
+    rt = data[[f"rt{i}" for i in range(1, n_trials + 1)]].to_numpy(dtype=np.float64)
+    correct = data[[f"accuracy{i}" for i in range(1, n_trials + 1)]].to_numpy()
+    return _as_bool(congruent, True), rt, _as_bool(correct, "Correct")
+
+
+def record_blocks(record):
+    """(congruent, rt, correct) arrays of shape (1, n) over a SessionRecord's buffers, without copying."""
+    congruent, rt, correct = record.views()
+    return (np.frombuffer(congruent, dtype=np.bool_)[np.newaxis],
+            np.frombuffer(rt, dtype=np.float64)[np.newaxis],
+            np.frombuffer(correct, dtype=np.bool_)[np.newaxis])
+
+
+def score_blocks(congruent, rt, correct):
+    """Per-session averages of correct RTs and accuracies for each congruency.
+
+    Follows analysis_V3: the average is taken over correct trials only and is
+    0.0 when there are none; accuracy is the number of correct trials of
+    that type divided by the number of trials in the block.
+    """
+    n_trials = congruent.shape[1]
+    scores = {}
+    for name, mask in (("incongruent", ~congruent & correct), ("congruent", congruent & correct)):
+        count = mask.sum(axis=1)
+        total = np.where(mask, rt, 0.0).sum(axis=1)
+        scores[f"avg_{name}"] = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+        scores[f"acc_{name}"] = count / n_trials
+    return scores
+
+
+def score(data, n_trials=N_TRIALS):
+    """Return a copy of data with the SCORE_COLUMNS filled in, as in rt_data_with_computed_averages.csv."""
+    scores = score_blocks(*trial_blocks(data, n_trials))
+    scored = data.copy()
+    for column in SCORE_COLUMNS:
+        scored[column] = scores[column]
+    return scored
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute per-session Stroop averages and accuracies.")
+    parser.add_argument("input", nargs="?", default="reaction_times.csv")
+    parser.add_argument("output", nargs="?", default="rt_data_with_computed_averages.csv")
+    args = parser.parse_args()
+
+    score(pd.read_csv(args.input)).to_csv(args.output, index=False)
@@ -0,0 +1,216 @@
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import special, stats
+
+from expand_long import expand_chunk
+
+CUTOFF = 2.5  # remove_large_vals in expanded_model.R, seconds
+MAD_K = 3.5  # Modified z-score limit (Iglewicz and Hoaglin)
+IQR_K = 1.5  # Tukey fences
+LOG_Z_K = 3.0
+TRIAL_CELLS = ["group", "trial", "trial_type"]
+SESSION_CELLS = ["group", "trial"]
+FLAG_COLUMNS = ["flag_invalid", "flag_cutoff", "flag_mad", "flag_iqr", "flag_log_z", "flag_any"]
+
+
+class Cells:
+    """Rows sorted once by cell, with the offsets needed for grouped statistics.
+
+    codes is the cell of every valid value, order sorts the values by cell
+    and then by value, and start/count delimit each cell in that order.
+    """
+
+    def __init__(self, codes, values, n_cells):
+        self.codes = codes
+        self.n_cells = n_cells
+        self.count = np.bincount(codes, minlength=n_cells)
+        self.start = np.concatenate([[0], np.cumsum(self.count)[:-1]])
+        order = np.argsort(values)
+        self.order = order[np.argsort(codes[order], kind="stable")]  # Radix sort on the small int codes
+        self.sorted = values[self.order]
+
+    def quantile(self, q, sorted_values=None):
+        """The q quantile of every cell (linear interpolation, as numpy and R type 7)."""
+        sorted_values = self.sorted if sorted_values is None else sorted_values
+        if not len(sorted_values):
+            return np.full(self.n_cells, np.nan)
+        position = self.start + q * np.maximum(self.count - 1, 0)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, self.start + np.maximum(self.count - 1, 0))
+        fraction = position - low
+        result = sorted_values[np.minimum(low, len(sorted_values) - 1)] * (1 - fraction) \
+            + sorted_values[np.minimum(high, len(sorted_values) - 1)] * fraction
+        return np.where(self.count > 0, result, np.nan)
+
+    def mean(self, values):
+        return np.bincount(self.codes, values, self.n_cells) / np.maximum(self.count, 1)
+
+    def rank(self):
+        """1-based rank of every value within its cell."""
+        rank = np.empty(len(self.codes), dtype=np.int64)
+        rank[self.order] = np.arange(len(self.codes)) - np.repeat(self.start, self.count) + 1
+        return rank
+
+
+def ppoints(rank, n):
+    """Plotting positions of 1-based ranks among n values, as R's ppoints and so qqnorm.
+
+    (rank - a) / (n + 1 - 2a), with a = 3/8 for n <= 10 and 1/2 above.
+    """
+    a = np.where(n <= 10, 3 / 8, 1 / 2)
+    return (rank - a) / (n + 1 - 2 * a)
+
+
+def cell_codes(data, cells):
+    """Integer cell of every row, numbered in sorted key order, and the key of each cell."""
+    combined = np.zeros(len(data), dtype=np.int64)
+    uniques = []
+    for column in cells:
+        codes, values = pd.factorize(data[column], sort=True)
+        combined = combined * (len(values) + 1) + codes + 1  # +1 keeps missing keys (-1) apart
+        uniques.append(np.concatenate([[None], np.asarray(values, dtype=object)]))
+    present, codes = np.unique(combined, return_inverse=True)
+    labels = []
+    for key in present:
+        label = []
+        for values in reversed(uniques):
+            key, index = divmod(key, len(values))
+            label.append(values[index])
+        labels.append(tuple(reversed(label)))
+    return codes, labels
+
+
+def screen(data, value="rt", cells=TRIAL_CELLS, cutoff=CUTOFF, mad_k=MAD_K, iqr_k=IQR_K, log_z_k=LOG_Z_K):
+    """Flag outliers and compute normality statistics for every cell at once.
+
+    Cells are the combinations of the cells columns (group x trial x trial
+    type by default). Every row keeps its place; flag columns are added
+    instead of dropping rows:
+
+    flag_invalid   missing or non-positive value
+    flag_cutoff    value >= cutoff (the fixed 2.5 s remove_large_vals)
+    flag_mad       modified z-score |0.6745 (x - median) / MAD| > mad_k
+    flag_iqr       outside [Q1 - iqr_k IQR, Q3 + iqr_k IQR]
+    flag_log_z     |z-score of log value| > log_z_k within the cell
+
+    log_z and qq_theoretical (the normal quantile of the row's rank within
+    its cell) give the QQ plot of every cell. The robust flags use every
+    valid value of a cell; the normality statistics use the values below
+    cutoff, as the QQ plots and Shapiro tests of expanded_model.R do.
+
+    Returns (screened rows, one row of statistics per cell).
+    """
+    x = pd.to_numeric(data[value], errors="coerce").to_numpy(dtype=np.float64)
+    valid = np.isfinite(x) & (x > 0)
+    codes, labels = cell_codes(data, cells)
+    n_cells = len(labels)
+
+    v = x[valid]
+    c = codes[valid]
+    log_v = np.log(v)
+    group = Cells(c, v, n_cells)
+
+    # Robust flags, from the median, MAD and quartiles of each cell
+    median = group.quantile(0.5)
+    deviation = np.abs(v - median[c])
+    mad = Cells(c, deviation, n_cells).quantile(0.5)
+    q1, q3 = group.quantile(0.25), group.quantile(0.75)
+    iqr = q3 - q1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        modified_z = 0.6745 * deviation / mad[c]
+    flag_mad = np.where(mad[c] > 0, modified_z > mad_k, False)
+    flag_iqr = (v < q1[c] - iqr_k * iqr[c]) | (v > q3[c] + iqr_k * iqr[c])
+
+    # Log-scale moments of each cell over the values below the cutoff
+    kept = v < cutoff if cutoff is not None else np.ones(len(v), dtype=bool)
+    normal = Cells(c[kept], log_v[kept], n_cells)
+    n = normal.count
+    mean = normal.mean(log_v[kept])
+    centred = log_v - mean[c]
+    m2 = np.bincount(c[kept], centred[kept] ** 2, n_cells) / np.maximum(n, 1)
+    m3 = np.bincount(c[kept], centred[kept] ** 3, n_cells) / np.maximum(n, 1)
+    m4 = np.bincount(c[kept], centred[kept] ** 4, n_cells) / np.maximum(n, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sd = np.sqrt(m2 * n / (n - 1))
+        skewness = m3 / m2 ** 1.5
+        kurtosis = m4 / m2 ** 2 - 3.0
+        log_z = centred / sd[c]
+    jarque_bera = n / 6.0 * (skewness ** 2 + kurtosis ** 2 / 4.0)
+
+    qq = np.full(len(v), np.nan)
+    qq[kept] = special.ndtri(ppoints(normal.rank(), n[c[kept]]))
+
+    # Shapiro-Wilk has no closed form; it runs once per cell on the already sorted values
+    shapiro_w = np.full(n_cells, np.nan)
+    shapiro_p = np.full(n_cells, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # scipy warns about the p-value for n > 5000
+        for cell in np.flatnonzero(n >= 3):
+            start = normal.start[cell]
+            shapiro_w[cell], shapiro_p[cell] = stats.shapiro(normal.sorted[start:start + n[cell]])
+
+    def per_row(values, fill):
+        # Spread values of the valid rows back over every row
+        column = np.full(len(x), fill, dtype=np.asarray(values).dtype)
+        column[valid] = values
+        return column
+
+    result = data.copy()
+    result["flag_invalid"] = ~valid
+    result["flag_cutoff"] = per_row(~kept, False)
+    result["flag_mad"] = per_row(flag_mad, False)
+    result["flag_iqr"] = per_row(flag_iqr, False)
+    result["flag_log_z"] = per_row(np.abs(log_z) > log_z_k, False)
+    result["flag_any"] = result[FLAG_COLUMNS[:-1]].to_numpy().any(axis=1)
+    result["log_z"] = per_row(log_z, np.nan)
+    result["qq_theoretical"] = per_row(qq, np.nan)
+
+    cell_stats = pd.DataFrame(list(labels), columns=cells)
+    cell_stats = cell_stats.assign(
+        n=group.count, n_invalid=np.bincount(codes[~valid], minlength=n_cells), n_below_cutoff=n,
+        median=median, mad=mad, q1=q1, q3=q3,
+        n_flag_mad=np.bincount(c, flag_mad, n_cells).astype(int),
+        n_flag_iqr=np.bincount(c, flag_iqr, n_cells).astype(int),
+        n_flag_cutoff=np.bincount(c, ~kept, n_cells).astype(int),
+        log_mean=mean, log_sd=sd, skewness=skewness, excess_kurtosis=kurtosis,
+        jarque_bera=jarque_bera, jarque_bera_p=np.exp(-jarque_bera / 2),  # chi2 with 2 df
+        shapiro_w=shapiro_w, shapiro_p=shapiro_p)
+    return result, cell_stats
+
+
+def screen_trials(wide, accuracy="correct", **options):
+    """Screen the RT of every trial, per group x trial x congruency."""
+    return screen(expand_chunk(wide, congruency="all", accuracy=accuracy), "rt", TRIAL_CELLS, **options)
+
+
+def screen_sessions(scored, measure="avg_incongruent", **options):
+    """Screen a per-session average, per group x trial.
+
+    Sessions with an average of 0.0 had no correct trials of that type
+    and are flagged invalid rather than screened.
+    """
+    return screen(scored, measure, SESSION_CELLS, **options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag outliers and test normality per group x trial x congruency.")
+    parser.add_argument("input", nargs="?", default="reaction_times.csv", help="wide session CSV")
+    parser.add_argument("--out", default="screened_trials.csv", help="trial rows with flag columns")
+    parser.add_argument("--stats", default="screening_stats.csv", help="one row of statistics per cell")
+    parser.add_argument("--accuracy", choices=["correct", "incorrect", "all"], default="correct")
+    parser.add_argument("--cutoff", type=float, default=CUTOFF)
+    parser.add_argument("--mad-k", type=float, default=MAD_K)
+    parser.add_argument("--iqr-k", type=float, default=IQR_K)
+    parser.add_argument("--log-z-k", type=float, default=LOG_Z_K)
+    args = parser.parse_args()
+
+    screened, cell_stats = screen_trials(pd.read_csv(args.input), args.accuracy, cutoff=args.cutoff,
+                                         mad_k=args.mad_k, iqr_k=args.iqr_k, log_z_k=args.log_z_k)
+    screened.to_csv(args.out, index=False)
+    cell_stats.to_csv(args.stats, index=False)
+    print(cell_stats[TRIAL_CELLS + ["n", "n_flag_cutoff", "n_flag_mad", "n_flag_iqr", "skewness", "shapiro_p"]]
+          .to_string(index=False))
+    print(f"{int(screened['flag_any'].sum())} of {len(screened)} trials flagged")
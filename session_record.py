@@ -0,0 +1,49 @@
+from array import array
+
+
+class SessionRecord:
+    """Preallocated trial record of one block.
+
+    Reaction times live in an array('d') and congruency and correctness in
+    array('B') of 0/1, all sized to the block up front, so recording a
+    trial only writes three slots in place. reset() starts a new block and
+    reuses the arrays when the size has not changed.
+
+    views() exposes the recorded part as memoryviews, which
+    scoring.record_blocks wraps with NumPy without copying to score the
+    block at its end.
+    """
+
+    __slots__ = ("rt", "congruent", "correct", "count")
+
+    def __init__(self, n_trials):
+        self.rt = array("d", bytes(8 * n_trials))
+        self.congruent = array("B", bytes(n_trials))
+        self.correct = array("B", bytes(n_trials))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self.rt)
+
+    def reset(self, n_trials=None):
+        """Forget the recorded trials, resizing if the next block has a different length."""
+        if n_trials is not None and n_trials != self.capacity:
+            self.__init__(n_trials)
+        self.count = 0
+
+    def add(self, rt, congruent, correct):
+        """Record the next trial; raises IndexError when the block is full."""
+        i = self.count
+        self.rt[i] = rt
+        self.congruent[i] = congruent
+        self.correct[i] = correct
+        self.count = i + 1
+
+    def views(self):
+        """(congruent, rt, correct) memoryviews over the recorded trials."""
+        count = self.count
+        return memoryview(self.congruent)[:count], memoryview(self.rt)[:count], memoryview(self.correct)[:count]
@@ -0,0 +1,277 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+
+DB_PATH = "reaction_times.db"
+CSV_PATH = "reaction_times.csv"
+N_TRIALS = 20  # Trial columns per block in the wide CSV layout
+SUMMARY_COLUMNS = ["avg_incongruent", "avg_congruent", "acc_incongruent", "acc_congruent"]
+SESSION_COLUMNS = "task, id, trial, gender, grp, age, time, seed, complete"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    task TEXT NOT NULL,
+    id TEXT NOT NULL,
+    trial INTEGER NOT NULL,
+    gender TEXT,
+    grp TEXT,
+    age INTEGER,
+    time TEXT,
+    seed INTEGER,
+    complete INTEGER NOT NULL DEFAULT 1,
+    latency_correction REAL,
+    PRIMARY KEY (task, id, trial)
+);
+CREATE TABLE IF NOT EXISTS trials (
+    task TEXT NOT NULL,
+    id TEXT NOT NULL,
+    trial INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    congruent INTEGER,
+    rt REAL,
+    correct INTEGER,
+    PRIMARY KEY (task, id, trial, n)
+);
+"""
+
+
+def wide_header(n_trials=N_TRIALS):
+    """Column names of the wide reaction_times.csv layout used by the notebooks."""
+    return (["id", "trial", "gender", "group", "age", "time"]
+            + [f"trial_type{i}" for i in range(1, n_trials + 1)]
+            + [f"rt{i}" for i in range(1, n_trials + 1)]
+            + [f"accuracy{i}" for i in range(1, n_trials + 1)]
+            + SUMMARY_COLUMNS)
+
+
+def _flag(value):
+    """Parse a True/False or Correct/Incorrect cell into 1, 0 or None."""
+    if value in ("True", "Correct"):
+        return 1
+    if value in ("False", "Incorrect"):
+        return 0
+    return None
+
+
+class SessionStore:
+    """SQLite store of sessions and their trials, indexed on (task, id, trial).
+
+    The database runs in WAL mode so several task windows can write while
+    someone exports. Duplicate checks are primary-key lookups instead of a
+    scan over every row of reaction_times.csv.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def exists(self, participant_id, trial, task="stroop"):
+        """Check if the given id and trial is already stored and complete for the task."""
+        row = self.conn.execute(
+            "SELECT 1 FROM sessions WHERE task = ? AND id = ? AND trial = ? AND complete = 1",
+            (task, str(participant_id), int(trial))).fetchone()
+        return row is not None
+
+    def partial_session(self, task, participant_id, trial):
+        """Return (seed, n_recorded) of an interrupted session, or None if there is none."""
+        participant_id = str(participant_id)
+        row = self.conn.execute(
+            "SELECT seed FROM sessions WHERE task = ? AND id = ? AND trial = ? AND complete = 0",
+            (task, participant_id, int(trial))).fetchone()
+        if row is None:
+            return None
+        (n_recorded,) = self.conn.execute(
+            "SELECT COUNT(*) FROM trials WHERE task = ? AND id = ? AND trial = ?",
+            (task, participant_id, int(trial))).fetchone()
+        return row[0], n_recorded
+
+    def begin_session(self, task, participant_id, trial, gender, group, age, current_time, seed=None):
+        """Register a session that is about to stream its trials; the caller commits."""
+        self.conn.execute(
+            f"INSERT OR IGNORE INTO sessions ({SESSION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            (task, str(participant_id), int(trial), gender, group, age, current_time, seed))
+
+    def add_trial(self, task, participant_id, trial, n, rt, congruent=None, correct=None):
+        """Store a single finished trial; the caller commits."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task, str(participant_id), int(trial), n, _to_int(congruent), rt, _to_int(correct)))
+
+    def set_correction(self, task, participant_id, trial, correction):
+        """Store the station's display latency correction of a session, in seconds; the caller commits."""
+        self.conn.execute(
+            "UPDATE sessions SET latency_correction = ? WHERE task = ? AND id = ? AND trial = ?",
+            (correction, task, str(participant_id), int(trial)))
+
+    def finish_session(self, task, participant_id, trial):
+        """Mark a streamed session as complete; the caller commits."""
+        self.conn.execute(
+            "UPDATE sessions SET complete = 1 WHERE task = ? AND id = ? AND trial = ?",
+            (task, str(participant_id), int(trial)))
+
+    def save_session(self, task, participant_id, trial, gender, group, age, current_time,
+                     reaction_times, congruent=None, correct=None, seed=None):
+        """Store one finished block.
+
+        congruent and correct are per-trial booleans; they are left out for
+        the reaction time task, which has neither.
+        """
+        participant_id = str(participant_id)
+        n_trials = len(reaction_times)
+        congruent = list(congruent) if congruent is not None else [None] * n_trials
+        correct = list(correct) if correct is not None else [None] * n_trials
+        with self.conn:
+            self.conn.execute(
+                f"INSERT INTO sessions ({SESSION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)",
+                (task, participant_id, int(trial), gender, group, age, current_time, seed))
+            self.conn.executemany(
+                "INSERT INTO trials VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(task, participant_id, int(trial), n, _to_int(congruent[n - 1]), rt, _to_int(correct[n - 1]))
+                 for n, rt in enumerate(reaction_times, start=1)])
+
+    def sessions(self, task="stroop"):
+        """Yield complete (session, trials) in insertion order.
+
+        session is (id, trial, gender, group, age, time, seed,
+        latency_correction) and trials a list of (n, congruent, rt, correct)
+        tuples.
+        """
+        trials = {}
+        for participant_id, trial, n, congruent, rt, correct in self.conn.execute(
+                "SELECT id, trial, n, congruent, rt, correct FROM trials WHERE task = ? ORDER BY id, trial, n",
+                (task,)):
+            trials.setdefault((participant_id, trial), []).append((n, congruent, rt, correct))
+
+        for session in self.conn.execute(
+                "SELECT id, trial, gender, grp, age, time, seed, latency_correction FROM sessions "
+                "WHERE task = ? AND complete = 1 ORDER BY rowid",
+                (task,)):
+            yield session, trials.get((session[0], session[1]), [])
+
+    def session(self, task, participant_id, trial):
+        """Return one complete (session, trials) in the shape sessions() yields, or None."""
+        participant_id = str(participant_id)
+        session = self.conn.execute(
+            "SELECT id, trial, gender, grp, age, time, seed, latency_correction FROM sessions "
+            "WHERE task = ? AND id = ? AND trial = ? AND complete = 1",
+            (task, participant_id, int(trial))).fetchone()
+        if session is None:
+            return None
+        return session, self.trials(task, participant_id, trial)
+
+    def trials(self, task, participant_id, trial):
+        """Stored (n, congruent, rt, correct) rows of a session, complete or not, in trial order."""
+        return self.conn.execute(
+            "SELECT n, congruent, rt, correct FROM trials WHERE task = ? AND id = ? AND trial = ? ORDER BY n",
+            (task, str(participant_id), int(trial))).fetchall()
+
+    def import_csv(self, path=CSV_PATH, task="stroop"):
+        """Load a station CSV, skipping sessions that are already stored.
+
+        The layout is detected from the header as in ingest.py: the wide
+        layout is imported under task, the stroop.py, test.py and
+        reaction.py layouts under their own task. Raises ValueError if the
+        header is not one of them. Returns the number of imported sessions.
+        """
+        from ingest import detect_schema, parse_file  # ingest imports this module
+
+        with open(path, newline="") as f:
+            header = next(csv.reader(f), None)
+        if header is None:
+            return 0
+        schema = detect_schema(header)
+        if schema is None:
+            raise ValueError(f"{path}: unknown header {header[:8]}")
+        if schema == "wide":
+            with open(path, newline="") as f:
+                return self._import_rows(((task, row) for row in csv.DictReader(f)), header)
+        canonical = wide_header(N_TRIALS)
+        rows = ((row_task, dict(zip(canonical, row))) for row_task, row in parse_file(path)[1])
+        return self._import_rows(rows, canonical)
+
+    def _import_rows(self, rows, header):
+        """Save (task, row) pairs of wide-layout dicts that are not stored yet."""
+        n_trials = sum(1 for name in header if name.startswith("rt"))
+        imported = 0
+        for task, row in rows:
+            if self.exists(row["id"], row["trial"], task):
+                continue
+            rts = [float(row[f"rt{i}"]) if row[f"rt{i}"] else None for i in range(1, n_trials + 1)]
+            congruent = [_flag(row.get(f"trial_type{i}")) for i in range(1, n_trials + 1)]
+            correct = [_flag(row.get(f"accuracy{i}")) for i in range(1, n_trials + 1)]
+            age = int(row["age"]) if row.get("age") else None
+            self.save_session(task, row["id"], row["trial"], row.get("gender"), row.get("group"),
+                              age, row.get("time"), rts, congruent, correct)
+            imported += 1
+        return imported
+
+    def export_csv(self, path=CSV_PATH, task="stroop", n_trials=N_TRIALS, correction=False):
+        """Write all sessions of a task in the wide layout read by the notebooks.
+
+        With correction, a latency_correction column (seconds to subtract
+        from the session's RTs) is appended after the layout's columns.
+        """
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(wide_header(n_trials) + (["latency_correction"] if correction else []))
+            for (participant_id, trial, gender, group, age, current_time, _, latency_correction), trials \
+                    in self.sessions(task):
+                trial_types = [""] * n_trials
+                rts = [""] * n_trials
+                accuracy = [""] * n_trials
+                for n, congruent, rt, correct in trials[:n_trials]:
+                    if congruent is not None:
+                        trial_types[n - 1] = "True" if congruent else "False"
+                    if rt is not None:
+                        rts[n - 1] = rt
+                    if correct is not None:
+                        accuracy[n - 1] = "Correct" if correct else "Incorrect"
+                row = ([participant_id, trial, gender, group, age, current_time]
+                       + trial_types + rts + accuracy + [""] * len(SUMMARY_COLUMNS))
+                if correction:
+                    row.append("" if latency_correction is None else latency_correction)
+                writer.writerow(row)
+
+
+def _to_int(value):
+    return None if value is None else int(bool(value))
+
+
+def open_store(path=DB_PATH, csv_path=CSV_PATH):
+    """Open the session store, importing the legacy CSV when the database is new."""
+    is_new = not os.path.exists(path)
+    store = SessionStore(path)
+    if is_new and os.path.exists(csv_path):
+        store.import_csv(csv_path)
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import or export the session store.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("csv", nargs="?", default=CSV_PATH)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--task", default="stroop", choices=["stroop", "word", "reaction"],
+                        help="task of the exported sessions, or of imported ones in the wide layout")
+    parser.add_argument("--correction", action="store_true", help="append the station latency correction column")
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    if args.command == "import":
+        try:
+            print(f"Imported {store.import_csv(args.csv, args.task)} sessions from {args.csv}")
+        except ValueError as error:
+            store.close()
+            sys.exit(f"Nothing imported: {error}")
+    else:
+        store.export_csv(args.csv, args.task, correction=args.correction)
+        print(f"Exported {args.task} sessions to {args.csv}")
+    store.close()
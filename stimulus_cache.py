@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+import pygame
+
+
+class SurfaceCache:
+    """Bounded LRU cache of pre-rendered text and button surfaces.
+
+    Font rendering is the slowest part of drawing a Stroop trial, so every
+    glyph and button the tasks can show is rendered once up front and each
+    trial only blits the cached surfaces.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def get(self, key, render):
+        """Return the surface stored under key, rendering it on a miss."""
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            return surface
+
+        surface = render()
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_size:
+            self._surfaces.popitem(last=False)  # Evict the least recently used surface
+        return surface
+
+    def text(self, font, text, color):
+        """Anti-aliased text rendered with the given font and color."""
+        return self.get(("text", font, text, color), lambda: font.render(text, True, color))
+
+    def button(self, font, text, color, size, fill, border, border_width=3):
+        """A filled, bordered button with centred text."""
+        def render():
+            surface = pygame.Surface(size)
+            surface.fill(fill)
+            pygame.draw.rect(surface, border, surface.get_rect(), border_width)
+            label = self.text(font, text, color)
+            surface.blit(label, label.get_rect(center=surface.get_rect().center))
+            return surface
+
+        return self.get(("button", font, text, color, size, fill, border, border_width), render)
+
+
+class DirtyRegions:
+    """Screen areas drawn in the current and the previous frame.
+
+    Passing flush() to pygame.display.update() pushes only what changed: the
+    new drawings plus the old ones they replace.
+    """
+
+    def __init__(self, screen_rect):
+        self.screen_rect = pygame.Rect(screen_rect)
+        self.reset()
+
+    def reset(self):
+        """Repaint the whole screen on the next flush, e.g. after another task drew on it."""
+        self.previous = [pygame.Rect(self.screen_rect)]
+        self.current = []
+
+    def add(self, rect):
+        """Register an area drawn in the current frame and return it."""
+        self.current.append(pygame.Rect(rect))
+        return rect
+
+    def flush(self):
+        """Return the rects to update and start a new frame."""
+        rects = self.previous + self.current
+        self.previous = self.current
+        self.current = []
+        return rects
@@ -1,9 +1,18 @@
 import pygame
-import random
-import time
-import csv
 from datetime import datetime
 
+from calibration import latency_correction, load_profile, refresh_ns
+from input_capture import InputCapture
+from scheduler import TrialScheduler, is_click
+from session_record import SessionRecord
+from scoring import record_blocks, score_blocks
+from session_store import open_store
+from stimulus_cache import DirtyRegions, SurfaceCache
+from telemetry import TrialTelemetry
+from timing import TrialClock
+from trial_plan import make_stroop_plan
+from trial_writer import TrialWriter
+
 # Define colors
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -16,13 +25,23 @@ PURPLE = (128, 0, 128)
 ORANGE = (255, 165, 0)
 
 class StroopTest:
-    def __init__(self):
+    def __init__(self, store=None, writer=None, capture=None):
         pygame.init()
         self.font = pygame.font.Font(None, 60)
         self.screen_width = 1500
         self.screen_height = 800
+        self.stimulus_y = 250  # Centre of the stimulus circle, px from the top
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         pygame.display.set_caption("Stroop Test")
+        self.clock = TrialClock()
+        self.capture = capture or InputCapture()  # Stamps input on its own thread when pynput is installed
+        self.capture.start()
+        self.scheduler = TrialScheduler(capture=self.capture)
+        self.store = store or open_store()
+        self.writer = writer or TrialWriter(self.store.path)
+        self.station_profile = load_profile()  # None until calibration.py was run on this station
+        # run_session.py --profile sets telemetry.profile to profile every block
+        self.telemetry = TrialTelemetry(measured_refresh_ns=refresh_ns(self.station_profile))
 
         # Mapping color names to their RGB values
         self.colors = {
@@ -34,18 +53,27 @@ class StroopTest:
             "ORANGE": ORANGE
         }
         self.color_names = list(self.colors.keys())  # List of color names
-        self.reaction_times = []
-        self.correctness = []  # To store whether the trial was correct or false
-        self.trial_types = []  # To store if the trial is compatible or incompatible
+        self.record = SessionRecord(20)  # RT, compatibility and correctness of every trial in the block
+        self.buttons = []  # Buttons currently on screen
+
+        # Pre-render every button (color name x font color) and the fixed texts once
+        self.button_size = (200, 100)
+        self.cache = SurfaceCache()
+        self.dirty = DirtyRegions(self.screen.get_rect())
+        for color_name in self.color_names:
+            for font_color in self.colors.values():
+                self.cache.button(self.font, color_name, font_color, self.button_size, LIGHT_GREY, BLACK)
+        self.cache.text(self.font, "Press the name of the color", BLACK)
+        self.cache.text(self.font, "Press the black circle to start new trial", BLACK)
 
     def draw_circle(self, color):
         """Draws a larger central circle filled with the given color."""
-        pygame.draw.circle(self.screen, color, (self.screen_width // 2, 250), 100)  # Adjusted y-position
+        with self.telemetry.draw():
+            self.dirty.add(pygame.draw.circle(self.screen, color, (self.screen_width // 2, self.stimulus_y), 100))
 
-    def draw_color_buttons(self, target_color_name, target_color, compatibility):
-        """Draws larger, light-grey rectangles with color names, each in a unique color, with one correct option."""
-        button_width = 200
-        button_height = 100
+    def draw_color_buttons(self, options, font_colors):
+        """Draws larger, light-grey rectangles with the planned color names, each in its planned font color."""
+        button_width, button_height = self.button_size
         # Updated positions for two rows of two buttons, adjusted left and right
         button_positions = [
             (self.screen_width // 2 - button_width // 2 - 150, 400),  # Adjusted y-position
@@ -55,83 +83,53 @@ class StroopTest:
         ]
 
         buttons = []
-        
-        # Ensure the correct color name is in the list of options
-        incorrect_options = [name for name in self.color_names if name != target_color_name]
-        options = random.sample(incorrect_options, 3) + [target_color_name]
-        available_colors = list(self.colors.values())
-        available_colors.remove(target_color) 
-
-        if compatibility:
-            # If compatible, include the target color in the font colors
-            font_colors = random.sample(available_colors, 3) + [target_color]
-             
-        else:
-            # Remove the circle color from font color options
-            font_colors = random.sample(available_colors, len(options)) 
-
-        # Combine options and font_colors into pairs and shuffle them together
-        combined = list(zip(options, font_colors))
-        random.shuffle(combined)
- 
 
-        # Unzip the shuffled pairs back into options and font_colors
-        options, font_colors = zip(*combined)
+        with self.telemetry.draw():
+            for position, color_name, font_color in zip(button_positions, options, font_colors):
+                button_rect = pygame.Rect(position[0], position[1], button_width, button_height)  # Button dimensions
+                buttons.append((button_rect, color_name, font_color))
 
-        for position, color_name, font_color in zip(button_positions, options, font_colors):
-            button_rect = pygame.Rect(position[0], position[1], button_width, button_height)  # Button dimensions
-            buttons.append((button_rect, color_name, font_color))
-            
-            # Draw the rectangle button with light grey fill
-            pygame.draw.rect(self.screen, LIGHT_GREY, button_rect)
-            pygame.draw.rect(self.screen, BLACK, button_rect, 3)  # Black border for button
-            
-            # Render the color name inside the rectangle
-            text_surface = self.font.render(color_name, True, font_color)
-            text_rect = text_surface.get_rect(center=button_rect.center)
-            self.screen.blit(text_surface, text_rect)
+                # Blit the pre-rendered light grey button with its black border and color name
+                button_surface = self.cache.button(self.font, color_name, font_color, self.button_size, LIGHT_GREY, BLACK)
+                self.dirty.add(self.screen.blit(button_surface, button_rect))
         
+        self.buttons = buttons
         return buttons
 
+
+    def clicked_button(self, buttons, event):
+        """Return the button hit by a mouse click event, or None."""
+        if not is_click(event):
+            return None
+        for button in buttons:
+            if button[0].collidepoint(event.pos):
+                return button
+        return None
     
     def check_if_exists(self, participant_id, trial):
-        """Check if the given id and trial already exists in the CSV file."""
-        try:
-            with open("reaction_times.csv", "r") as f:
-                reader = csv.reader(f)
-                header = next(reader)  # Read the header
-
-                # Iterate over each row in the CSV
-                for row in reader:
-                    if row[0] == str(participant_id) and int(row[1]) == trial:
-                        print(f"ID {participant_id} and Trial {trial} already exist.")  # Print statement
-                        return True  # Found matching ID and trial
-        except FileNotFoundError:
-            return False  
-        return False  # ID and trial do not exist    
-
-    def save_reaction_times(self, reaction_times, correctness, trial_types, participant_id, trial, group, gender, age, current_time):
-        """Save reaction times and correctness to a CSV file, appending new data"""
-
-        with open("reaction_times.csv", "a", newline='') as f:
-            writer = csv.writer(f)
-            # If the file is empty, write the header
-            if f.tell() == 0:  
-                tries = [i for i in range(1, 11)]
-                # Adding correctness columns and trial type column
-                header = ["id", "trial", "gender","group", "age", "time", "trial_type"] + tries + ["correctness_" + str(i) for i in range(1, 11)]
-                writer.writerow(header) 
-
-            # Create a row with participant information and reaction times/correctness
-            
-            # Prepare the data for writing
-            reaction_times = reaction_times + [None] * (10 - len(reaction_times))  # Fill the rest with None
-            row = [participant_id, trial, gender,group,  age, current_time, trial_types]  # Use first trial type as an example
-            row.extend(reaction_times)
-            row.extend(correctness)
-            writer.writerow(row)
-
-    def run_test(self, participant_id, trial, group, gender, age, current_time, practice=False):   
+        """Check if the given id and trial already exists in the session store."""
+        if self.store.exists(participant_id, trial, task="stroop"):
+            print(f"ID {participant_id} and Trial {trial} already exist.")  # Print statement
+            return True  # Found matching ID and trial
+        return False  # ID and trial do not exist
+
+    def save_reaction_times(self, complete):
+        """Wait until every streamed trial is on disk, marking the session complete if all trials were run"""
+        if self.station_profile is not None:
+            stimulus_y = self.stimulus_y / self.screen_height
+            self.writer.set_correction(latency_correction(self.station_profile, stimulus_y))
+        if complete:
+            self.writer.finish()
+        self.writer.flush()
+
+    def report_block(self):
+        """Print the block's average correct RTs and accuracies, scored straight from the record's buffers."""
+        if len(self.record):
+            scores = score_blocks(*record_blocks(self.record))
+            print(", ".join(f"{name}={values[0]:.3f}" for name, values in scores.items()))
+
+    def run_test(self, participant_id, trial, group, gender, age, current_time, practice=False, seed=None):
+        """Run one block of the Stroop test. Returns True if every trial was run."""
         running = True
         trial_count = 0  # Initialize trial count
         if practice:
@@ -139,91 +137,104 @@ class StroopTest:
         else:
             total_trials = 20  # Set total trials to 20
         
-        # Create a list of trial types: 10 compatible and 10 incompatible
+        self.record.reset(total_trials)
+        self.dirty.reset()  # Another task may have drawn on the shared window since the last block
+
+        if not practice:
+            # Pick up an interrupted session where it stopped, replaying the same plan
+            resumed = self.store.partial_session("stroop", participant_id, trial)
+            if resumed is not None:
+                seed, trial_count = resumed
+                print(f"Resuming ID {participant_id} and Trial {trial} at trial {trial_count + 1}.")
+                # Refill the record with the stored trials so the block summary covers the whole block
+                for _, compatible, reaction_time, correct in self.store.trials("stroop", participant_id, trial):
+                    self.record.add(reaction_time, compatible, correct)
+
+        # Build the whole session up front: exactly 20% compatible trials, reproducible from the seed
+        plan = make_stroop_plan(total_trials, len(self.color_names), seed)
+        color_values = list(self.colors.values())
+        if not practice:
+            self.writer.begin("stroop", participant_id, trial, gender, group, age, current_time, plan.seed)
+        self.telemetry.begin("stroop", participant_id, trial, practice)
         
-        compatibility_trials = []
         while running and trial_count < total_trials:
-            self.show_continue_message() 
+            if not self.show_continue_message():
+                break
+            self.telemetry.schedule()  # The stimulus is due as soon as it can be drawn
             self.screen.fill(WHITE)
             
             # Draw the title
-            title_surface = self.font.render("Press the name of the color", True, BLACK)
+            title_surface = self.cache.text(self.font, "Press the name of the color", BLACK)
             title_rect = title_surface.get_rect(center=(self.screen_width // 2, 100))  # Adjusted y-position for title
-            self.screen.blit(title_surface, title_rect)
-
-            target_color_name = random.choice(self.color_names)
-            target_color = self.colors[target_color_name]
+            self.dirty.add(self.screen.blit(title_surface, title_rect))
 
-            self.draw_circle(target_color)
+            target, _, compatible, options, font_colors = plan.trial(trial_count)
+            target_color_name = self.color_names[target]
+            self.draw_circle(color_values[target])
             
             # Draw color buttons and store their properties
-            compatible = random.choices([True, False], weights=[0.2, 0.8])[0]
-            compatibility_trials.append(compatible)
-            buttons = self.draw_color_buttons(target_color_name, target_color, compatible)
-            pygame.display.flip()
-            
-            # Start timing user response
-            start_time = time.time()
-            clicked = False
-            
-            while not clicked:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                        clicked = True
-                    elif event.type == pygame.MOUSEBUTTONDOWN:
-                        pos = pygame.mouse.get_pos()
-                        correct_selection = False
-                        for button_rect, color_name, font_color in buttons:
-                            if button_rect.collidepoint(pos):
-                                reaction_time = time.time() - start_time
-                                self.reaction_times.append(reaction_time)
-                                
-                                if color_name == target_color_name:
-                                    self.correctness.append("Correct")  # Store correctness
-                                else:
-                                    self.correctness.append("False")  # Store correctness
-
-                                clicked = True  # Move to the next trial on any click
-                                break
+            buttons = self.draw_color_buttons([self.color_names[i] for i in options], [color_values[i] for i in font_colors])
+
+            # Push only the changed areas to the display and start timing at stimulus onset
+            self.clock.flip(self.dirty.flush())
+
+            # Sleep until a button is clicked; clicks outside the buttons are ignored
+            event = self.scheduler.wait(lambda event: self.clicked_button(buttons, event) is not None)
+            if event.type == pygame.QUIT:
+                running = False
+                break
+
+            button_rect, color_name, font_color = self.clicked_button(buttons, event)
+            reaction_time = self.clock.record_response(event)
+            correct = color_name == target_color_name
+            self.record.add(reaction_time, compatible, correct)  # Written in place, no allocation
+            self.telemetry.record(trial_count + 1, self.clock, self.scheduler, event)
+
+            if not practice:
+                # Hand the trial to the background writer; no disk I/O here
+                self.writer.add(trial_count + 1, reaction_time, compatible, correct)
             
             trial_count += 1  # Increment trial count after each trial
             
-            pygame.time.delay(500)  # Brief delay before next trial
-            self.show_continue_message()  # Show continue message after any trial
+            running = self.scheduler.pause(500)  # Brief delay before next trial
+            running = running and self.show_continue_message()  # Show continue message after any trial
             
         if not practice:
-            self.save_reaction_times(self.reaction_times, self.correctness, compatibility_trials, participant_id, trial, group, gender, age, current_time)
+            self.save_reaction_times(trial_count == total_trials)
+        self.report_block()
+        self.telemetry.end()  # Timing of every trial goes to the sidecar file
+        return trial_count == total_trials
 
     def show_continue_message(self):
-        """Displays a black circle with instructions for the user to click to continue."""
+        """Displays a black circle with instructions for the user to click to continue.
+
+        Returns False if the window was closed instead.
+        """
         self.screen.fill(WHITE)
         
         # Define the circle's position and color (black)
         circle_position = (self.screen_width // 2, 250)
         circle_radius = 100
-        pygame.draw.circle(self.screen, BLACK, circle_position, circle_radius)
+        self.dirty.add(pygame.draw.circle(self.screen, BLACK, circle_position, circle_radius))
         
         # Render the instruction text below the circle
         message = "Press the black circle to start new trial"
-        text_surface = self.font.render(message, True, BLACK)
+        text_surface = self.cache.text(self.font, message, BLACK)
         text_rect = text_surface.get_rect(center=(self.screen_width // 2, circle_position[1] + 150))  # Position below the circle
-        self.screen.blit(text_surface, text_rect)
+        self.dirty.add(self.screen.blit(text_surface, text_rect))
         
-        pygame.display.flip()
+        pygame.display.update(self.dirty.flush())
         
-        waiting = True
-        while waiting:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    waiting = False
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    pos = pygame.mouse.get_pos()
-                    
-                    # Check if the click is within the circle's radius
-                    distance = ((pos[0] - circle_position[0]) ** 2 + (pos[1] - circle_position[1]) ** 2) ** 0.5
-                    if distance <= circle_radius:
-                        waiting = False  # Exit the waiting loop if the black circle is clicked
+        # Sleep until the black circle is clicked
+        def in_circle(event):
+            if not is_click(event):
+                return False
+            pos = event.pos
+            distance = ((pos[0] - circle_position[0]) ** 2 + (pos[1] - circle_position[1]) ** 2) ** 0.5
+            return distance <= circle_radius
+
+        event = self.scheduler.wait(in_circle)
+        return event.type != pygame.QUIT
 
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+import argparse
+import cProfile
+import csv
+import math
+import os
+import socket
+import statistics
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pygame
+
+from timing import now_ns
+
+TELEMETRY_PATH = "timing.csv"
+PROFILE_DIR = "profiles"
+DEFAULT_REFRESH_HZ = 60
+COLUMNS = ["station", "task", "id", "trial", "practice", "n", "scheduled_ns", "onset_ns", "onset_delay_ns",
+           "flip_ns", "draw_ns", "queue_lag_ns", "dropped_frames", "refresh_ns"]
+
+
+_assumed_refresh = False  # Set once the 60 Hz fallback has been reported
+
+
+def refresh_interval_ns(measured_ns=None):
+    """Frame interval of the display in ns.
+
+    Uses the desktop refresh rate when pygame reports it
+    (get_desktop_refresh_rates, pygame-ce 2.2 and later; pygame 2.6 has no
+    such call), then the interval measured by calibration.py, and only
+    then assumes 60 Hz, saying so once.
+    """
+    global _assumed_refresh
+    get_rates = getattr(pygame.display, "get_desktop_refresh_rates", None)
+    if get_rates is not None:
+        try:
+            rates = get_rates()
+        except pygame.error:
+            rates = []
+        if rates and rates[0]:
+            return 1_000_000_000 // rates[0]  # Primary display, where the task windows open
+    if measured_ns:
+        return int(measured_ns)
+    if not _assumed_refresh:
+        print(f"Display refresh rate unknown and not calibrated, assuming {DEFAULT_REFRESH_HZ} Hz",
+              file=sys.stderr)
+        _assumed_refresh = True
+    return 1_000_000_000 // DEFAULT_REFRESH_HZ
+
+
+class TrialTelemetry:
+    """Per-trial timing-quality record kept next to the reaction times.
+
+    For every answered trial it stores when the stimulus was meant to appear
+    and when the flip actually returned, how long the flip and the drawing
+    took, how long the response sat in the event queue (only known for
+    events stamped by their producer) and how many frames the flip missed.
+    Rows are kept in memory during the session and appended to a sidecar CSV
+    at the end, so the response loop never writes to disk.
+
+    Set profile to run the session under cProfile; the stats are dumped to
+    profile_dir with one file per session. measured_refresh_ns is the
+    station's calibrated refresh interval, used when pygame cannot report
+    the refresh rate.
+    """
+
+    def __init__(self, path=TELEMETRY_PATH, profile=False, profile_dir=PROFILE_DIR, measured_refresh_ns=None):
+        self.path = path
+        self.measured_refresh_ns = measured_refresh_ns
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.station = socket.gethostname()
+        self.refresh_ns = None
+        self.session = None
+        self.rows = []
+        self._scheduled_ns = None
+        self._draw_ns = 0
+        self._profiler = None
+
+    def begin(self, task, participant_id, trial, practice=False):
+        """Start collecting rows for a session."""
+        self.session = (task, participant_id, trial, int(practice))
+        self.rows = []
+        self.refresh_ns = refresh_interval_ns(self.measured_refresh_ns)
+        self._scheduled_ns = None
+        self._draw_ns = 0
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def schedule(self, scheduled_ns=None):
+        """Mark when the next stimulus is due (now by default) and start timing its drawing."""
+        self._scheduled_ns = now_ns() if scheduled_ns is None else scheduled_ns
+        self._draw_ns = 0
+
+    @contextmanager
+    def draw(self):
+        """Add the time spent inside the block to the drawing time of the next stimulus."""
+        start_ns = now_ns()
+        try:
+            yield
+        finally:
+            self._draw_ns += now_ns() - start_ns
+
+    def record(self, n, clock, scheduler, event):
+        """Store the timing of trial n right after clock.record_response(event)."""
+        onset_ns = clock.onsets_ns[-1]
+        scheduled_ns = onset_ns if self._scheduled_ns is None else self._scheduled_ns
+        queue_lag_ns = None
+        if getattr(event, "timestamp_ns", None) is not None and scheduler.dequeued_ns is not None:
+            queue_lag_ns = scheduler.dequeued_ns - event.timestamp_ns
+        self.rows.append(self.session + (n, scheduled_ns, onset_ns, onset_ns - scheduled_ns, clock.flip_ns,
+                                         self._draw_ns, queue_lag_ns, clock.flip_ns // self.refresh_ns,
+                                         self.refresh_ns))
+        self._scheduled_ns = None
+        self._draw_ns = 0
+
+    def end(self):
+        """Append the session's rows to the sidecar file and stop the profiler."""
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            task, participant_id, trial, practice = self.session
+            name = f"{task}_{participant_id}_{trial}" + ("_practice" if practice else "")
+            self._profiler.dump_stats(os.path.join(self.profile_dir, name + ".prof"))
+            self._profiler = None
+        if self.rows:
+            new_file = not os.path.exists(self.path)
+            with open(self.path, "a", newline="") as f:
+                writer = csv.writer(f, lineterminator="\n")
+                if new_file:
+                    writer.writerow(COLUMNS)
+                writer.writerows((self.station,) + row for row in self.rows)
+        self.session = None
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(math.ceil(q * len(ordered)) - 1, 0))]
+
+
+def report(path=TELEMETRY_PATH, max_onset_ms=5.0, max_dropped=0.01):
+    """Summarise a sidecar file per station.
+
+    A station is flagged when its 95th percentile onset delay exceeds
+    max_onset_ms or more than max_dropped of its flips missed a frame.
+    Returns a list of dicts, one per station.
+    """
+    by_station = defaultdict(list)
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            by_station[row["station"]].append(row)
+
+    summary = []
+    for station, rows in sorted(by_station.items()):
+        onset_ms = [int(row["onset_delay_ns"]) / 1e6 for row in rows]
+        flip_ms = [int(row["flip_ns"]) / 1e6 for row in rows]
+        draw_ms = [int(row["draw_ns"]) / 1e6 for row in rows]
+        lag_ms = [int(row["queue_lag_ns"]) / 1e6 for row in rows if row["queue_lag_ns"]]
+        dropped = sum(int(row["dropped_frames"]) > 0 for row in rows) / len(rows)
+        p95_onset = _percentile(onset_ms, 0.95)
+        summary.append({
+            "station": station,
+            "trials": len(rows),
+            "onset_median_ms": statistics.median(onset_ms),
+            "onset_p95_ms": p95_onset,
+            "flip_median_ms": statistics.median(flip_ms),
+            "draw_median_ms": statistics.median(draw_ms),
+            "queue_lag_max_ms": max(lag_ms) if lag_ms else None,
+            "dropped_share": dropped,
+            "flagged": p95_onset > max_onset_ms or dropped > max_dropped,
+        })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise per-trial timing quality by station.")
+    parser.add_argument("path", nargs="?", default=TELEMETRY_PATH)
+    parser.add_argument("--max-onset-ms", type=float, default=5.0, help="flag stations whose p95 onset delay exceeds this")
+    parser.add_argument("--max-dropped", type=float, default=0.01, help="flag stations with more flips missing a frame")
+    args = parser.parse_args()
+
+    for station in report(args.path, args.max_onset_ms, args.max_dropped):
+        print(", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                        for key, value in station.items()))
@@ -1,9 +1,18 @@
 import pygame
-import random
-import time
-import csv
 from datetime import datetime
 
+from calibration import latency_correction, load_profile, refresh_ns
+from input_capture import InputCapture
+from scheduler import TrialScheduler, is_click
+from session_record import SessionRecord
+from scoring import record_blocks, score_blocks
+from session_store import open_store
+from stimulus_cache import DirtyRegions, SurfaceCache
+from telemetry import TrialTelemetry
+from timing import TrialClock
+from trial_plan import make_word_stroop_plan
+from trial_writer import TrialWriter
+
 # Define colors
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -16,13 +25,22 @@ ORANGE = (255, 165, 0)
 LIGHT_GREY = (200, 200, 200)
 
 class StroopTest:
-    def __init__(self):
+    def __init__(self, store=None, writer=None, capture=None):
         pygame.init()
         self.font = pygame.font.Font(None, 60)
         self.screen_width = 1500
         self.screen_height = 800
+        self.stimulus_y = 250  # Centre of the color word, px from the top
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         pygame.display.set_caption("Stroop Test")
+        self.clock = TrialClock()
+        self.capture = capture or InputCapture()
+        self.capture.start()
+        self.scheduler = TrialScheduler(capture=self.capture)
+        self.store = store or open_store()
+        self.writer = writer or TrialWriter(self.store.path)
+        self.station_profile = load_profile()
+        self.telemetry = TrialTelemetry(measured_refresh_ns=refresh_ns(self.station_profile))
 
         self.colors = {
             "RED": RED,
@@ -33,21 +51,30 @@ class StroopTest:
             "ORANGE": ORANGE
         }
         self.color_names = list(self.colors.keys())
-        self.reaction_times = []
-        self.correctness = []
-        self.trial_types = []
+        self.record = SessionRecord(20)
+        self.buttons = []
+
+        # Pre-render every (color name, ink color) word, every button and the fixed texts once
+        self.large_font = pygame.font.Font(None, 100)
+        self.button_size = (200, 100)
+        self.cache = SurfaceCache()
+        self.dirty = DirtyRegions(self.screen.get_rect())
+        for color_name in self.color_names:
+            self.cache.button(self.font, color_name, BLACK, self.button_size, LIGHT_GREY, BLACK)
+            for ink_color in self.colors.values():
+                self.cache.text(self.large_font, color_name, ink_color)
+        self.cache.text(self.font, "Press the black circle to start new trial", BLACK)
 
     def draw_color_word(self, target_color_name, ink_color):
         """Draws the target color name in the given ink color at the top center."""
-        large_font = pygame.font.Font(None, 100)
-        text_surface = large_font.render(target_color_name, True, ink_color)
-        text_rect = text_surface.get_rect(center=(self.screen_width // 2, 250))
-        self.screen.blit(text_surface, text_rect)
-
-    def draw_color_buttons(self, target_ink_color_name):
-        """Draws four buttons with color names, all in black ink, and ensures target ink color is among the options."""
-        button_width = 200
-        button_height = 100
+        with self.telemetry.draw():
+            text_surface = self.cache.text(self.large_font, target_color_name, ink_color)
+            text_rect = text_surface.get_rect(center=(self.screen_width // 2, self.stimulus_y))
+            self.dirty.add(self.screen.blit(text_surface, text_rect))
+
+    def draw_color_buttons(self, options):
+        """Draws four buttons with the planned color names, all in black ink."""
+        button_width, button_height = self.button_size
         button_positions = [
             (self.screen_width // 2 - button_width // 2 - 150, 400),
             (self.screen_width // 2 + button_width // 2 - 50, 400),
@@ -56,131 +83,134 @@ class StroopTest:
         ]
 
         buttons = []
-        
-        # Ensure the target ink color name is included among the options
-        incorrect_options = [name for name in self.color_names if name != target_ink_color_name]
-        options = random.sample(incorrect_options, 3) + [target_ink_color_name]
-        random.shuffle(options)  # Shuffle to randomize the position of the correct answer
-
-        for position, color_name in zip(button_positions, options):
-            button_rect = pygame.Rect(position[0], position[1], button_width, button_height)
-            buttons.append((button_rect, color_name))
 
-            pygame.draw.rect(self.screen, LIGHT_GREY, button_rect)
-            pygame.draw.rect(self.screen, BLACK, button_rect, 3)
+        with self.telemetry.draw():
+            for position, color_name in zip(button_positions, options):
+                button_rect = pygame.Rect(position[0], position[1], button_width, button_height)
+                buttons.append((button_rect, color_name))
 
-            text_surface = self.font.render(color_name, True, BLACK)
-            text_rect = text_surface.get_rect(center=button_rect.center)
-            self.screen.blit(text_surface, text_rect)
+                button_surface = self.cache.button(self.font, color_name, BLACK, self.button_size, LIGHT_GREY, BLACK)
+                self.dirty.add(self.screen.blit(button_surface, button_rect))
 
+        self.buttons = buttons
         return buttons
 
+    def clicked_button(self, buttons, event):
+        """Return the button hit by a mouse click event, or None."""
+        if not is_click(event):
+            return None
+        for button in buttons:
+            if button[0].collidepoint(event.pos):
+                return button
+        return None
+
     def check_if_exists(self, participant_id, trial):
-        """Check if the given ID and trial already exists in the CSV file."""
-        try:
-            with open("reaction_times.csv", "r") as f:
-                reader = csv.reader(f)
-                header = next(reader)
-
-                for row in reader:
-                    if row[0] == str(participant_id) and int(row[1]) == trial:
-                        print(f"ID {participant_id} and Trial {trial} already exist.")
-                        return True
-        except FileNotFoundError:
-            return False
+        """Check if the given ID and trial already exists in the session store."""
+        if self.store.exists(participant_id, trial, task="word"):
+            print(f"ID {participant_id} and Trial {trial} already exist.")
+            return True
         return False
 
-    def save_reaction_times(self, participant_id, trial, group, gender, age, current_time):
-        """Save reaction times and correctness to a CSV file, appending new data."""
-        with open("reaction_times.csv", "a", newline='') as f:
-            writer = csv.writer(f)
-            if f.tell() == 0:
-                header = ["id", "trial", "gender", "group", "age", "time", "trial_type"] + \
-                         ["reaction_time_" + str(i+1) for i in range(10)] + \
-                         ["correctness_" + str(i+1) for i in range(10)]
-                writer.writerow(header)
-
-            row = [participant_id, trial, gender, group, age, current_time, self.trial_types]
-            row.extend(self.reaction_times)
-            row.extend(self.correctness)
-            writer.writerow(row)
-
-    def run_test(self, participant_id, trial, group, gender, age, current_time, practice=False):
+    def save_reaction_times(self, complete):
+        """Wait until every streamed trial is on disk, marking the session complete if all trials were run."""
+        if self.station_profile is not None:
+            stimulus_y = self.stimulus_y / self.screen_height
+            self.writer.set_correction(latency_correction(self.station_profile, stimulus_y))
+        if complete:
+            self.writer.finish()
+        self.writer.flush()
+
+    def report_block(self):
+        """Print the block's average correct RTs and accuracies, scored straight from the record's buffers."""
+        if len(self.record):
+            scores = score_blocks(*record_blocks(self.record))
+            print(", ".join(f"{name}={values[0]:.3f}" for name, values in scores.items()))
+
+    def run_test(self, participant_id, trial, group, gender, age, current_time, practice=False, seed=None):
+        """Run one block of the Stroop test. Returns True if every trial was run."""
         running = True
         trial_count = 0
         total_trials = 5 if practice else 20
+        self.record.reset(total_trials)
+        self.dirty.reset()  # Another task may have drawn on the shared window since the last block
+        if not practice:
+            resumed = self.store.partial_session("word", participant_id, trial)
+            if resumed is not None:
+                seed, trial_count = resumed
+                print(f"Resuming ID {participant_id} and Trial {trial} at trial {trial_count + 1}.")
+                # Refill the record with the stored trials so the block summary covers the whole block
+                for _, compatible, reaction_time, correct in self.store.trials("word", participant_id, trial):
+                    self.record.add(reaction_time, compatible, correct)
+
+        plan = make_word_stroop_plan(total_trials, len(self.color_names), seed)
+        color_values = list(self.colors.values())
+        if not practice:
+            self.writer.begin("word", participant_id, trial, gender, group, age, current_time, plan.seed)
+        self.telemetry.begin("word", participant_id, trial, practice)
 
         while running and trial_count < total_trials:
-            self.show_continue_message()
+            if not self.show_continue_message():
+                break
+            self.telemetry.schedule()
             self.screen.fill(WHITE)
 
-            target_color_name = random.choice(self.color_names)
-            target_ink_color = self.colors[target_color_name]
-            compatible = random.choices([True, False], weights=[0.2, 0.8])[0]
-
-            if not compatible:
-                possible_ink_colors = [color for name, color in self.colors.items() if name != target_color_name]
-                target_ink_color = random.choice(possible_ink_colors)
-
-            self.trial_types.append("True" if compatible else "False")
-            target_ink_color_name = [name for name, color in self.colors.items() if color == target_ink_color][0]
-            self.draw_color_word(target_color_name, target_ink_color)
-            buttons = self.draw_color_buttons(target_ink_color_name)
-            pygame.display.flip()
-
-            start_time = time.time()
-            clicked = False
-
-            while not clicked:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        running = False
-                        clicked = True
-                    elif event.type == pygame.MOUSEBUTTONDOWN:
-                        pos = pygame.mouse.get_pos()
-                        for button_rect, color_name in buttons:
-                            if button_rect.collidepoint(pos):
-                                reaction_time = time.time() - start_time
-                                self.reaction_times.append(reaction_time)
-
-                                if color_name == target_ink_color_name:
-                                    self.correctness.append("Correct")
-                                else:
-                                    self.correctness.append("Incorrect")
-                                clicked = True
-                                break
+            word, ink, compatible, options, _ = plan.trial(trial_count)
+            target_ink_color_name = self.color_names[ink]
+
+            self.draw_color_word(self.color_names[word], color_values[ink])
+            buttons = self.draw_color_buttons([self.color_names[i] for i in options])
+            self.clock.flip(self.dirty.flush())
+
+            event = self.scheduler.wait(lambda event: self.clicked_button(buttons, event) is not None)
+            if event.type == pygame.QUIT:
+                running = False
+                break
+
+            button_rect, color_name = self.clicked_button(buttons, event)
+            reaction_time = self.clock.record_response(event)
+            correct = color_name == target_ink_color_name
+            self.record.add(reaction_time, compatible, correct)
+            self.telemetry.record(trial_count + 1, self.clock, self.scheduler, event)
+
+            if not practice:
+                self.writer.add(trial_count + 1, reaction_time, compatible, correct)
 
             trial_count += 1
-            pygame.time.delay(500)
-            self.show_continue_message()
+            running = self.scheduler.pause(500)
+            running = running and self.show_continue_message()
 
         if not practice:
-            self.save_reaction_times(participant_id, trial, group, gender, age, current_time)
+            self.save_reaction_times(trial_count == total_trials)
+        self.report_block()
+        self.telemetry.end()
+        return trial_count == total_trials
 
     def show_continue_message(self):
-        """Displays a black circle with instructions for the user to click to continue."""
+        """Displays a black circle with instructions for the user to click to continue.
+
+        Returns False if the window was closed instead.
+        """
         self.screen.fill(WHITE)
         circle_position = (self.screen_width // 2, 250)
         circle_radius = 100
-        pygame.draw.circle(self.screen, BLACK, circle_position, circle_radius)
+        self.dirty.add(pygame.draw.circle(self.screen, BLACK, circle_position, circle_radius))
 
         message = "Press the black circle to start new trial"
-        text_surface = self.font.render(message, True, BLACK)
+        text_surface = self.cache.text(self.font, message, BLACK)
         text_rect = text_surface.get_rect(center=(self.screen_width // 2, circle_position[1] + 150))
-        self.screen.blit(text_surface, text_rect)
-
-        pygame.display.flip()
-
-        waiting = True
-        while waiting:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    waiting = False
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    pos = pygame.mouse.get_pos()
-                    distance = ((pos[0] - circle_position[0]) ** 2 + (pos[1] - circle_position[1]) ** 2) ** 0.5
-                    if distance <= circle_radius:
-                        waiting = False
+        self.dirty.add(self.screen.blit(text_surface, text_rect))
+
+        pygame.display.update(self.dirty.flush())
+
+        def in_circle(event):
+            if not is_click(event):
+                return False
+            pos = event.pos
+            distance = ((pos[0] - circle_position[0]) ** 2 + (pos[1] - circle_position[1]) ** 2) ** 0.5
+            return distance <= circle_radius
+
+        event = self.scheduler.wait(in_circle)
+        return event.type != pygame.QUIT
 
 if __name__ == "__main__":
     test = StroopTest()
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+import columnar
+from session_store import wide_header
+
+
+def wide_sessions():
+    """Three sessions in the reaction_times.csv layout; the middle one has no answered trial."""
+    rows = []
+    for participant_id, trial, rts in ((1, 1, [0.5, 0.6]), (1, 2, []), (2, 1, [0.7])):
+        row = dict.fromkeys(wide_header(), np.nan)
+        row.update(id=participant_id, trial=trial, gender="F", group="exercise", age=21, time="10:00:00")
+        for i, rt in enumerate(rts, start=1):
+            row.update({f"trial_type{i}": i == 1, f"rt{i}": rt, f"accuracy{i}": "Correct"})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=wide_header())
+
+
+def test_round_trip_keeps_sessions_without_answered_trials(tmp_path):
+    data = wide_sessions()
+    columnar.save(tmp_path, *columnar.from_wide(data))
+    wide = columnar.to_wide(*columnar.load(tmp_path))
+
+    assert len(wide) == len(data)
+    fixed = ["id", "trial", "gender", "group", "age", "time"]
+    pd.testing.assert_frame_equal(wide[fixed], data[fixed], check_dtype=False)
+    rt_columns = [f"rt{i}" for i in range(1, 21)]
+    np.testing.assert_array_equal(wide[rt_columns].to_numpy(dtype=np.float64),
+                                  data[rt_columns].to_numpy(dtype=np.float64))
+    assert wide[rt_columns].iloc[1].isna().all()
+
+
+def test_long_rows_carry_their_session(tmp_path):
+    columnar.save(tmp_path, *columnar.from_wide(wide_sessions()))
+    long = columnar.to_long(*columnar.load(tmp_path))
+
+    assert long["id"].tolist() == [1, 1, 2]
+    assert long["trial_type"].tolist() == ["Congruent", "Incongruent", "Congruent"]
@@ -0,0 +1,68 @@
+import time
+
+import pygame
+
+
+def now_ns():
+    """Current time on the monotonic high-resolution clock, in nanoseconds."""
+    return time.perf_counter_ns()
+
+
+def ns_to_s(ns):
+    """Convert a nanosecond interval to seconds."""
+    return ns / 1_000_000_000
+
+
+class TrialClock:
+    """Shared timing engine used by the reaction and Stroop tasks.
+
+    Stimulus onset is stamped right after pygame.display.flip() returns and
+    the response is taken from the input event itself, both on the
+    perf_counter_ns clock. Every completed trial keeps its raw onset and
+    response stamps in onsets_ns / responses_ns so no precision is lost to
+    rounding into seconds. flip_ns is how long the last flip blocked.
+    """
+
+    def __init__(self):
+        self.onsets_ns = []
+        self.responses_ns = []
+        self.onset_ns = None
+        self.flip_ns = 0
+
+    def reset(self):
+        """Forget all recorded trials, e.g. between a practice and a real block."""
+        self.onsets_ns = []
+        self.responses_ns = []
+        self.onset_ns = None
+
+    def flip(self, rects=None):
+        """Flip the display, or update only the given rects, and stamp the stimulus onset."""
+        start_ns = now_ns()
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        self.onset_ns = now_ns()
+        self.flip_ns = self.onset_ns - start_ns
+        return self.onset_ns
+
+    def event_time_ns(self, event):
+        """Return when an input event happened on the perf_counter_ns clock.
+
+        Events that were stamped by their producer carry a timestamp_ns
+        attribute and that value is used. Plain SDL events do not expose
+        their timestamp through pygame, so they are stamped as they are
+        dequeued.
+        """
+        timestamp = getattr(event, "timestamp_ns", None)
+        if timestamp is None:
+            return now_ns()
+        return timestamp
+
+    def record_response(self, event):
+        """Store onset and response for the current trial and return the RT in seconds."""
+        response_ns = self.event_time_ns(event)
+        self.onsets_ns.append(self.onset_ns)
+        self.responses_ns.append(response_ns)
+        self.onset_ns = None
+        return ns_to_s(response_ns - self.onsets_ns[-1])
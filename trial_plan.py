@@ -0,0 +1,128 @@
+import random
+from array import array
+
+N_OPTIONS = 4  # Answer buttons shown per Stroop trial
+CONGRUENT_RATIO = 0.2  # Share of congruent trials, as in the original random.choices weights
+
+
+def new_seed():
+    """Fresh random seed to be stored alongside a session's results."""
+    return random.SystemRandom().randrange(2 ** 32)
+
+
+def congruent_schedule(rng, n_trials, congruent_ratio):
+    """Shuffled 0/1 flags with exactly round(n_trials * congruent_ratio) ones."""
+    n_congruent = round(n_trials * congruent_ratio)
+    flags = [1] * n_congruent + [0] * (n_trials - n_congruent)
+    rng.shuffle(flags)
+    return flags
+
+
+class StroopPlan:
+    """A whole Stroop session generated before the first trial.
+
+    Each trial is stored as color indices in flat arrays: word and ink of the
+    stimulus, a congruent flag and N_OPTIONS answer buttons with the ink each
+    button name is printed in (-1 when buttons are printed in black).
+    """
+
+    def __init__(self, seed, word, ink, congruent, options, option_inks):
+        self.seed = seed
+        self.word = array("b", word)
+        self.ink = array("b", ink)
+        self.congruent = array("b", congruent)
+        self.options = array("b", options)
+        self.option_inks = array("b", option_inks)
+
+    def __len__(self):
+        return len(self.word)
+
+    def trial(self, i):
+        """Return (word, ink, congruent, options, option_inks) of trial i."""
+        start = i * N_OPTIONS
+        end = start + N_OPTIONS
+        return (self.word[i], self.ink[i], bool(self.congruent[i]),
+                self.options[start:end], self.option_inks[start:end])
+
+
+class ReactionPlan:
+    """Pre-drawn go-signal delays for a reaction time session.
+
+    Premature presses restart the wait with a fresh delay, so attempts rather
+    than trials index the plan and it wraps around if a session needs more.
+    """
+
+    def __init__(self, seed, delays):
+        self.seed = seed
+        self.delays = array("d", delays)
+
+    def __len__(self):
+        return len(self.delays)
+
+    def delay(self, attempt):
+        """Delay in seconds before the go signal of the given attempt."""
+        return self.delays[attempt % len(self.delays)]
+
+
+def make_stroop_plan(n_trials, n_colors, seed=None, congruent_ratio=CONGRUENT_RATIO):
+    """Plan for stroop.py: a colored circle and buttons printed in colored ink.
+
+    The target is the circle's color and always one of the options. On
+    congruent trials the target's button is printed in the target color,
+    otherwise no button uses it.
+    """
+    seed = new_seed() if seed is None else seed
+    rng = random.Random(seed)
+    word, ink, options, option_inks = [], [], [], []
+    flags = congruent_schedule(rng, n_trials, congruent_ratio)
+
+    for congruent in flags:
+        target = rng.randrange(n_colors)
+        others = [color for color in range(n_colors) if color != target]
+        names = rng.sample(others, N_OPTIONS - 1) + [target]
+        if congruent:
+            inks = rng.sample(others, N_OPTIONS - 1) + [target]
+        else:
+            inks = rng.sample(others, N_OPTIONS)
+        pairs = list(zip(names, inks))
+        rng.shuffle(pairs)
+
+        word.append(target)
+        ink.append(target)
+        options.extend(name for name, _ in pairs)
+        option_inks.extend(button_ink for _, button_ink in pairs)
+
+    return StroopPlan(seed, word, ink, flags, options, option_inks)
+
+
+def make_word_stroop_plan(n_trials, n_colors, seed=None, congruent_ratio=CONGRUENT_RATIO):
+    """Plan for test.py: a color word in colored ink and black answer buttons.
+
+    The answer is the ink color; on congruent trials it matches the word.
+    """
+    seed = new_seed() if seed is None else seed
+    rng = random.Random(seed)
+    word, ink, options = [], [], []
+    flags = congruent_schedule(rng, n_trials, congruent_ratio)
+
+    for congruent in flags:
+        target_word = rng.randrange(n_colors)
+        if congruent:
+            target_ink = target_word
+        else:
+            target_ink = rng.choice([color for color in range(n_colors) if color != target_word])
+        names = rng.sample([color for color in range(n_colors) if color != target_ink], N_OPTIONS - 1) + [target_ink]
+        rng.shuffle(names)
+
+        word.append(target_word)
+        ink.append(target_ink)
+        options.extend(names)
+
+    return StroopPlan(seed, word, ink, flags, options, [-1] * len(options))
+
+
+def make_reaction_plan(n_attempts, seed=None, min_delay=2, max_delay=5):
+    """Plan of uniformly drawn go-signal delays for reaction.py."""
+    seed = new_seed() if seed is None else seed
+    rng = random.Random(seed)
+    return ReactionPlan(seed, [rng.uniform(min_delay, max_delay) for _ in range(n_attempts)])
@@ -0,0 +1,134 @@
+import queue
+import sys
+import threading
+
+from collector import to_record
+from session_store import DB_PATH, SessionStore
+
+FLUSH_TIMEOUT_S = 30.0
+
+
+class TrialWriter:
+    """Streams finished trials to the session store from a background thread.
+
+    The task thread only puts small tuples on a queue, so the response loop
+    never waits on disk I/O. The writer thread commits whatever has queued up
+    in one transaction, which makes every trial durable shortly after it is
+    answered: a crash or a closed window loses at most the trial in flight,
+    and the session can be resumed from the stored seed.
+
+    With a LiveStats, every stored trial also updates the running
+    per-group statistics on the writer thread. With a CollectorClient,
+    every session marked complete is also pushed to the collection server.
+
+    A failing operation is reported and skipped without stopping the
+    thread; the error is raised from the next flush().
+    """
+
+    def __init__(self, path=DB_PATH, stats=None, collector=None):
+        self.path = path
+        self.stats = stats
+        self.collector = collector
+        self.session = None
+        self.error = None  # Last failure of the writer thread, raised by flush()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trial-writer", daemon=True)
+        self._thread.start()
+
+    def begin(self, task, participant_id, trial, gender, group, age, current_time, seed):
+        """Start streaming a session; trials are numbered from 1 within it."""
+        self.session = (task, participant_id, trial)
+        self._queue.put(("begin", (task, participant_id, trial, gender, group, age, current_time, seed)))
+
+    def add(self, n, rt, congruent=None, correct=None):
+        """Queue trial n of the current session."""
+        self._queue.put(("trial", self.session + (n, rt, congruent, correct)))
+
+    def set_correction(self, correction):
+        """Queue the station latency correction (seconds) of the current session."""
+        self._queue.put(("correction", self.session + (correction,)))
+
+    def finish(self):
+        """Mark the current session as complete."""
+        self._queue.put(("finish", self.session))
+        self.session = None
+
+    def flush(self, timeout=FLUSH_TIMEOUT_S):
+        """Block until everything queued so far is committed.
+
+        Raises RuntimeError if an operation failed since the last flush, or
+        if the writer thread did not get there within timeout seconds.
+        """
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        if not done.wait(timeout):
+            state = "is stuck" if self._thread.is_alive() else "has stopped"
+            raise RuntimeError(f"trial writer {state}, trials queued since the last flush may not be stored")
+        error, self.error = self.error, None
+        if error is not None:
+            raise RuntimeError(f"trial writer failed: {error}") from error
+
+    def close(self):
+        """Commit outstanding trials and stop the writer thread."""
+        self._queue.put(("close", None))
+        self._thread.join()
+
+    def _run(self):
+        store = SessionStore(self.path)
+        store.conn.execute("PRAGMA synchronous=FULL")  # One fsync per batch commit
+        groups = {}  # (task, id, trial) -> group of the sessions begun on this writer
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            # Everything that queued up while we were waiting goes into the same commit
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            flushed = []
+            finished = []
+            for op, args in batch:
+                try:
+                    if op == "begin":
+                        store.begin_session(*args)
+                        groups[args[:3]] = args[4]
+                    elif op == "trial":
+                        store.add_trial(*args)
+                        if self.stats is not None:
+                            task, participant_id, trial, _, rt, congruent, correct = args
+                            self.stats.add(task, groups.get(args[:3]), trial, rt, congruent, correct)
+                    elif op == "correction":
+                        store.set_correction(*args)
+                    elif op == "finish":
+                        store.finish_session(*args)
+                        finished.append(args)
+                    elif op == "flush":
+                        flushed.append(args)
+                    elif op == "close":
+                        running = False
+                except Exception as error:
+                    self._failed(f"{op} {args}", error)
+            try:
+                store.conn.commit()
+            except Exception as error:
+                store.conn.rollback()
+                finished = []
+                self._failed("commit", error)
+            try:
+                if self.stats is not None:
+                    self.stats.refresh(force=not running)
+                if self.collector is not None:
+                    for task, participant_id, trial in finished:
+                        self.collector.send(to_record(task, *store.session(task, participant_id, trial)))
+            except Exception as error:
+                self._failed("live stats or collector", error)
+            # Release flush() only after the failures of this batch are recorded
+            for done in flushed:
+                done.set()
+        store.close()
+
+    def _failed(self, what, error):
+        print(f"trial writer: {what} failed: {error!r}", file=sys.stderr)
+        self.error = error